@@ -0,0 +1,47 @@
+"""short_url unique short_tag and id allocator
+
+Revision ID: 7a9312466540
+Revises: 7c16dc6f5bed
+Create Date: 2026-10-17 09:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a9312466540'
+down_revision: Union[str, Sequence[str], None] = '7c16dc6f5bed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 应用启动时的 create_all 可能已经建好了这些表和索引
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('short_url_id_allocator'):
+        op.create_table('short_url_id_allocator',
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('next_id', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+        )
+
+    if 'ix_short_url_short_tag' not in {ix['name'] for ix in inspector.get_indexes('short_url')}:
+        # 旧的随机 tag 可能已经重复, 重复的行本来就查不到, 保留 id 最小的一行,
+        # 其余的行在 tag 后面追加 id, 这样才能建唯一索引
+        op.execute(
+            """
+            UPDATE short_url SET short_tag = short_tag || '-' || CAST(id AS VARCHAR)
+            WHERE id NOT IN (SELECT MIN(id) FROM short_url GROUP BY short_tag)
+            """
+        )
+        op.create_index(op.f('ix_short_url_short_tag'), 'short_url', ['short_tag'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_short_url_short_tag'), table_name='short_url')
+    op.drop_table('short_url_id_allocator')
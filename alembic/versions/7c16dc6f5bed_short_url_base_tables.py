@@ -0,0 +1,50 @@
+"""short_url base tables
+
+Revision ID: 7c16dc6f5bed
+Revises: 5dd94ab6a765
+Create Date: 2026-10-17 09:41:22.972622
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c16dc6f5bed'
+down_revision: Union[str, Sequence[str], None] = '5dd94ab6a765'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 以前 short_url 的表只由应用启动时的 create_all 创建, 已经存在时跳过
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('user'):
+        op.create_table('user',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('username', sa.String(length=20), nullable=True),
+        sa.Column('password', sa.String(length=32), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not inspector.has_table('short_url'):
+        op.create_table('short_url',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('short_tag', sa.String(length=20), nullable=False),
+        sa.Column('short_url', sa.String(), nullable=True),
+        sa.Column('long_url', sa.String(), nullable=False),
+        sa.Column('visits_count', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.String(length=20), nullable=True),
+        sa.Column('msg_content', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('short_url')
+    op.drop_table('user')
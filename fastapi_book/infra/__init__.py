@@ -1,8 +1,16 @@
 
 from .redis import RedisConfig, RedisInfra
 from .db import DatabaseConfig, DatabaseInfra
+from .password import PasswordHasher, password_hasher
 
 
-__all__ = ["RedisConfig", "RedisInfra", "DatabaseConfig", "DatabaseInfra"]
+__all__ = [
+    "RedisConfig",
+    "RedisInfra",
+    "DatabaseConfig",
+    "DatabaseInfra",
+    "PasswordHasher",
+    "password_hasher",
+]
 
 
@@ -0,0 +1,82 @@
+# infra/password.py
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from fastapi_book import BaseInfra
+
+
+class PasswordHasher(BaseInfra):
+    """
+    共享的密码哈希执行器。
+
+    bcrypt 每次计算要几百毫秒, 在事件循环里直接调用会卡住所有请求。这里放到独立的线程池里执行
+    (bcrypt 计算时会释放 GIL), 并用信号量限制同时进行的计算数, 排队的请求数可以作为监控指标。
+    """
+
+    def __init__(self, max_workers: int | None = None, schemes: list[str] | None = None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._context = CryptContext(schemes=schemes or ["bcrypt"], deprecated="auto")
+        self._executor: ThreadPoolExecutor | None = None
+        # 信号量在第一次使用时按事件循环创建, 模块导入时还没有运行中的循环
+        self._semaphore: asyncio.Semaphore | None = None
+        self._semaphore_loop: asyncio.AbstractEventLoop | None = None
+        self.running = 0
+        self.queued = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="password-hasher"
+            )
+        return self._executor
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def stats(self) -> dict[str, int]:
+        return {"max_workers": self.max_workers, "running": self.running, "queued": self.queued}
+
+    async def _run(self, func, *args):
+        semaphore = self.semaphore
+        self.queued += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+    async def hash_password(self, plain_password: str) -> str:
+        return await self._run(self._context.hash, plain_password)
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self._context.verify, plain_password, hashed_password)
+
+    def is_hash(self, value: str) -> bool:
+        """判断存储的值是否是本执行器认识的哈希 (而不是旧的明文密码)。"""
+        return self._context.identify(value) is not None
+
+    async def shutdown(self):
+        """password_hasher 是进程内所有应用共享的, 只在进程退出时调用。"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    max_workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "0")) or None
+)
@@ -1,5 +1,7 @@
 import pathlib
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from jose import JWTError
+from redis.exceptions import ResponseError
 from starlette.endpoints import WebSocketEndpoint
 from typing import Optional
 
@@ -7,13 +9,55 @@ from starlette.responses import FileResponse
 
 from ...infra import AuthToeknHelper
 from fastapi import WebSocket, status
+from starlette.websockets import WebSocketState
 
 from ...impl import room_manager, UserInfo, Room
+from ...impl.codec import SUBPROTOCOL, msgpack_available, unpack_client_message
 
 
 router_chat = APIRouter(tags=["聊天室"])
 
 
+def check_token(token: str) -> dict:
+    try:
+        return AuthToeknHelper.token_decode(token)
+    except JWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+
+@router_chat.get("/api/v1/room/stats")
+async def room_stats(_payload: dict = Depends(check_token)):
+    # 每个房间的发送队列深度和丢帧数
+    return room_manager.stats()
+
+
+@router_chat.get("/api/v1/room/{room_name}/history")
+async def room_history(
+    room_name: str,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    _payload: dict = Depends(check_token),
+):
+    # 从新到旧翻页: 下一页把 next_before 作为 before 传回来
+    try:
+        messages = await room_manager.history(room_name, before=before, limit=limit)
+    except ResponseError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid message id")
+    next_before = messages[0]["id"] if len(messages) == limit else None
+    return {"messages": messages, "next_before": next_before}
+
+
+@router_chat.get("/api/v1/room/{room_name}/online")
+async def room_online_users(
+    room_name: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    _payload: dict = Depends(check_token),
+):
+    # 全集群的在线人数和按最近心跳排序的在线列表
+    return await room_manager.online(room_name, offset=offset, limit=limit)
+
+
 @router_chat.websocket_route("/api/v1/room/socketws")
 @router_chat.websocket_route("/api/v1/room/socketws/")
 class ChatRoomWebSocket(WebSocketEndpoint):
@@ -41,23 +85,46 @@ class ChatRoomWebSocket(WebSocketEndpoint):
     async def close_clean_user_websocket(self, code: int, websocket: WebSocket):
         if self.curr_user and self.room:
             await self.room.logout(self.curr_user)
-        await websocket.close(code=code)
+        # 慢客户端可能已经被服务端以 1008 关闭
+        if websocket.application_state == WebSocketState.CONNECTED:
+            await websocket.close(code=code)
 
     async def on_connect(self, _websocket: WebSocket):
         try:
+            # 客户端提供 msgpack 子协议时用二进制帧, 否则保持 JSON
+            binary = msgpack_available() and SUBPROTOCOL in _websocket.scope.get("subprotocols", [])
             # 确认链接
-            await _websocket.accept()
+            await _websocket.accept(subprotocol=SUBPROTOCOL if binary else None)
             # 初始化当前用户信息
             self.curr_user = await self.get_user(_websocket)
             self.room = await room_manager.get_room("default")
-            await self.room.login(self.curr_user, _websocket)
+            # 断线重连时带上收到的最后一条消息 id, 先补发错过的消息
+            logged_in = await self.room.login(
+                self.curr_user,
+                _websocket,
+                last_id=_websocket.query_params.get("last_id"),
+                binary=binary,
+            )
+            if not logged_in:
+                # 同一账号已经有一个在线的会话, 拒绝这个连接, 也不能去注销那个会话
+                self.room = None
+                await _websocket.close(
+                    code=status.WS_1008_POLICY_VIOLATION, reason="already online"
+                )
         except Exception as e:
             print("连接异常:", e)
             await self.close_clean_user_websocket(
                 code=status.WS_1011_INTERNAL_ERROR, websocket=_websocket
             )
 
-    async def on_receive(self, _websocket: WebSocket, msg: str):
+    async def on_receive(self, _websocket: WebSocket, msg: str | bytes):
+        if self.room is None:
+            return
+        if isinstance(msg, bytes):
+            # 二进制客户端发来的是 msgpack 编码的字符串
+            msg = unpack_client_message(msg)
+            if msg is None:
+                return
         if self.curr_user is None:
             await self.close_clean_user_websocket(
                 code=status.WS_1008_POLICY_VIOLATION, websocket=_websocket
@@ -66,7 +133,7 @@ class ChatRoomWebSocket(WebSocketEndpoint):
         await self.room.send_message(self.curr_user, message=msg)
 
     async def on_disconnect(self, _websocket: WebSocket, _close_code: int):
-        await self.close_clean_user_websocket(
-            code=status.WS_1000_NORMAL_CLOSURE, websocket=_websocket
-        )
+        # 连接已经断开, 只需要退出房间, 再 close 会抛 WebSocketDisconnect
+        if self.curr_user and self.room:
+            await self.room.logout(self.curr_user)
         del self.curr_user
@@ -12,6 +12,11 @@ function createChatApp() {
       const sendmsg = ref("");
       const messagesContainer = ref(null);
       const currentUser = ref("");
+      // 收到的最后一条消息 id, 重连时传给服务端补发错过的消息
+      let lastId = null;
+      // 自动重连的等待时间, 每次失败翻倍, 连接成功后复位
+      let reconnectDelay = 1000;
+      const MAX_RECONNECT_DELAY = 30000;
 
       // 从URL参数获取当前用户名
       const getCurrentUser = () => {
@@ -32,7 +37,11 @@ function createChatApp() {
         }
 
         // 实例化socket并链接到服务端的WebSocket
-        const fullWsUrl = wsurl.value + window.location.search;
+        const params = new URLSearchParams(window.location.search);
+        if (lastId) {
+          params.set("last_id", lastId);
+        }
+        const fullWsUrl = wsurl.value + "?" + params.toString();
         socket.value = new WebSocket(fullWsUrl);
 
         // 监听socket连接
@@ -47,6 +56,7 @@ function createChatApp() {
 
       const open = () => {
         console.log("socket连接成功");
+        reconnectDelay = 1000;
         addSystemMessage("连接成功", "已连接到聊天室");
       };
 
@@ -55,14 +65,32 @@ function createChatApp() {
         addSystemMessage("连接错误", "无法连接到服务器");
       };
 
-      const close = () => {
-        console.log("socket已经关闭");
+      const close = (event) => {
+        console.log("socket已经关闭", event.code, event.reason);
+        if (event.code === 1008) {
+          // 服务端按策略断开 (已经在别处登录 / 接收太慢等), 重连也会被拒绝, 不再重试
+          addSystemMessage("连接断开", event.reason || "被服务器断开");
+          return;
+        }
         addSystemMessage("连接断开", "与服务器的连接已断开");
+        // 其它非正常关闭时退避重连, 并补发断线期间的消息
+        if (event.code !== 1000) {
+          setTimeout(initSocket, reconnectDelay);
+          reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY);
+        }
       };
 
       const getMessage = (msg) => {
-        const obj = JSON.parse(msg.data);
+        const data = JSON.parse(msg.data);
+        // 繁忙的房间会把多条消息合并成一个数组发过来
+        (Array.isArray(data) ? data : [data]).forEach(handleFrame);
+      };
+
+      const handleFrame = (obj) => {
         console.log(obj);
+        if (obj.id) {
+          lastId = obj.id;
+        }
 
         if (obj.type === "user_list") {
           users.value = obj.data.users_list;
@@ -74,6 +102,8 @@ function createChatApp() {
             users.value.splice(userIndex, 1);
           }
           addSystemMessage("用户离开", obj.message);
+        } else if (obj.type === "throttle") {
+          addSystemMessage("发送太快", `请 ${Math.ceil(obj.retry_after_ms / 1000)} 秒后再试`);
         } else if (obj.type === "message") {
           addChatMessage(obj.user.username, obj.message, obj.user.datetime);
         }
@@ -127,7 +157,7 @@ function createChatApp() {
           try {
             // 关闭WebSocket连接
             if (socket.value) {
-              socket.value.close();
+              socket.value.close(1000);
             }
             
             // 调用登出接口
@@ -167,7 +197,7 @@ function createChatApp() {
 
       onUnmounted(() => {
         if (socket.value) {
-          socket.value.close();
+          socket.value.close(1000);
         }
       });
 
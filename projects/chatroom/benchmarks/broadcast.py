@@ -0,0 +1,116 @@
+"""
+房间广播的微基准: 对比逐个连接 send_json (每个接收者编码一次) 和编码一次共享同一帧。
+
+不需要 Redis 和真实的 WebSocket。per_recipient / encode_once 只比较编码方式, 逐个连接顺序发送;
+room_fanout 把 Redis 收到的 payload 交给 Room._handle_message, 计时到所有连接的写任务发完为止。
+
+    uv run python -m projects.chatroom.benchmarks.broadcast --members 10,1000,10000 --messages 200
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from ..impl.room_manager import RoomManager, Room, chat_frame
+from ..impl.schemas import RedisMessage, UserInfo, UserConnection
+
+
+class NullWebSocket:
+    """只计数的假 WebSocket; send_json 与 starlette 的实现一样先 json.dumps 再发文本。"""
+
+    sent = 0
+
+    async def send_text(self, data: str):
+        NullWebSocket.sent += 1
+
+    async def send_json(self, data, mode: str = "text"):
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+
+async def per_recipient(sockets: list[NullWebSocket], data: str):
+    """改造前的做法: 解析 payload 重建 dict, 再对每个连接各自 send_json。"""
+    msg = RedisMessage.model_validate_json(data)
+    for websocket in sockets:
+        await websocket.send_json(
+            {
+                "type": "message",
+                "user": {"phone_number": msg.user.phone_number, "username": msg.user.username},
+                "message": msg.message,
+            }
+        )
+
+
+async def encode_once(sockets: list[NullWebSocket], data: str):
+    frame = chat_frame(data)
+    for websocket in sockets:
+        await websocket.send_text(frame)
+
+
+async def make_room(members: int, queue_size: int) -> tuple[Room, list[NullWebSocket]]:
+    room_manager = RoomManager(None, queue_size=queue_size)
+    room = await room_manager.get_room("bench")
+    sockets = []
+    # 不走 login: 每个人进房间都会广播一次, 建一万人的房间就是 O(n^2)
+    for i in range(members):
+        websocket = NullWebSocket()
+        connection = UserConnection(
+            phone_number=str(i), username=f"user{i}", websocket=websocket, queue_size=queue_size
+        )
+        connection.start()
+        room._users[connection.phone_number] = connection
+        sockets.append(websocket)
+    return room, sockets
+
+
+async def timed(broadcast, sockets: list[NullWebSocket], payload: str, messages: int) -> float:
+    start = time.perf_counter()
+    for _ in range(messages):
+        await broadcast(sockets, payload)
+    return (time.perf_counter() - start) / messages * 1000
+
+
+async def bench(members: int, messages: int) -> dict[str, float]:
+    payload = RedisMessage(
+        node="bench", user=UserInfo(phone_number="0", username="user0"), message="hello, " * 8
+    ).model_dump_json()
+    # 队列足够大, 计时期间不丢帧
+    room, sockets = await make_room(members, queue_size=messages)
+
+    result = {
+        "members": members,
+        "per_recipient_ms": await timed(per_recipient, sockets, payload, messages),
+        "encode_once_ms": await timed(encode_once, sockets, payload, messages),
+    }
+
+    NullWebSocket.sent = 0
+    start = time.perf_counter()
+    for _ in range(messages):
+        await room._handle_message(room.chat_channel, payload)
+        # 和真实的监听循环一样, 每条消息之后让出事件循环
+        await asyncio.sleep(0)
+    while NullWebSocket.sent < members * messages:
+        await asyncio.sleep(0)
+    result["room_fanout_ms"] = (time.perf_counter() - start) / messages * 1000
+
+    for connection in room._users.values():
+        await connection.close()
+    await room.room_manager.close_room(room.room_name)
+    return result
+
+
+async def main(args):
+    print(f"{'members':>8} {'per_recipient':>16} {'encode_once':>14} {'speedup':>8} {'room_fanout':>14}")
+    for members in (int(n) for n in args.members.split(",")):
+        result = await bench(members, args.messages)
+        print(
+            f"{members:>8} {result['per_recipient_ms']:>13.3f} ms {result['encode_once_ms']:>11.3f} ms"
+            f" {result['per_recipient_ms'] / result['encode_once_ms']:>7.2f}x"
+            f" {result['room_fanout_ms']:>11.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--members", default="10,1000,10000")
+    parser.add_argument("--messages", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,354 @@
+"""
+聊天室 WebSocket 压测: 一个节点能撑多少并发用户。
+
+用 AuthToeknHelper 直接签发 --clients 个用户的 token, 每个用户开一个 WebSocket 连到
+/api/v1/room/socketws, 其中 --senders 个用户以合计 --rate 条/秒的速度发 --duration 秒消息。
+消息内容是发送时刻, 所有连接收到后算出端到端的扇出延迟, 报告 p50/p95/p99/max、丢失条数、
+服务端每个连接占用的内存 (连接前后 RSS 之差) 和发消息期间的 CPU 占用。
+
+默认启动一个 uvicorn 子进程, --fake-redis 时子进程用 fakeredis 代替 Redis, 不需要外部服务;
+--url 连接已经在运行的服务, 同时给出 --pid 才统计服务端内存和 CPU (读 /proc, 仅限 Linux)。
+--binary 使用 msgpack 子协议。
+
+    uv run python -m projects.chatroom.benchmarks.load --fake-redis --clients 1000 --rate 50
+    uv run python -m projects.chatroom.benchmarks.load --url ws://127.0.0.1:8000 --pid 12345
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import websockets
+
+from ..infra import AuthToeknHelper
+from ..impl.codec import SUBPROTOCOL, FrameType, msgpack
+
+
+WS_PATH = "/api/v1/room/socketws"
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="已经在运行的服务, 例如 ws://127.0.0.1:8000; 不给时启动 uvicorn 子进程")
+    parser.add_argument("--pid", type=int, help="--url 对应的服务进程, 用来统计内存和 CPU")
+    parser.add_argument("--fake-redis", action="store_true", help="子进程用 fakeredis 代替 Redis")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--senders", type=int, default=10, help="发消息的用户数, 其余只接收")
+    parser.add_argument("--rate", type=float, default=20.0, help="所有发送者合计每秒发送的消息数")
+    parser.add_argument("--duration", type=float, default=10.0, help="发消息的秒数")
+    parser.add_argument("--drain", type=float, default=10.0, help="发完之后最多等待多少秒收齐")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--binary", action="store_true", help="使用 msgpack 子协议")
+    parser.add_argument("--json", dest="json_path", help="把结果写到 JSON 文件")
+    # 内部使用: 以子进程身份运行服务端
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """nearest-rank 百分位。"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class ProcessStats:
+    """从 /proc 读取一个进程的 RSS 和 CPU 时间。"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.ticks = os.sysconf("SC_CLK_TCK")
+
+    def rss(self) -> int:
+        with open(f"/proc/{self.pid}/statm") as f:
+            return int(f.read().split()[1]) * self.page_size
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            # 第二个字段是带括号的进程名, 可能含空格, 从右括号之后开始数
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+
+class BenchClient:
+    """一个压测用户: 连接、后台读帧并记录自己收到的聊天消息的延迟。"""
+
+    def __init__(self, index: int, binary: bool, latencies: list[float]):
+        self.phone_number = f"bench{index:06d}"
+        self.binary = binary
+        self.latencies = latencies
+        self.websocket = None
+        self.received = 0
+        self.throttled = 0
+        self._reader: asyncio.Task | None = None
+
+    def token(self) -> str:
+        return AuthToeknHelper.token_encode(
+            {"phone_number": self.phone_number, "username": self.phone_number}
+        )
+
+    async def connect(self, base_url: str):
+        self.websocket = await websockets.connect(
+            f"{base_url}{WS_PATH}?token={self.token()}",
+            subprotocols=[SUBPROTOCOL] if self.binary else None,
+            max_queue=None,
+            ping_interval=None,
+        )
+        if self.binary and self.websocket.subprotocol != SUBPROTOCOL:
+            raise RuntimeError("server did not accept the msgpack subprotocol")
+        self._reader = asyncio.create_task(self._read())
+
+    async def send(self, text: str):
+        if self.binary:
+            await self.websocket.send(msgpack.packb(text))
+        else:
+            await self.websocket.send(text)
+
+    def _messages(self, data):
+        if self.binary:
+            frame = msgpack.unpackb(data)
+            if frame[0] == FrameType.MESSAGE:
+                yield frame[3]
+            elif frame[0] == FrameType.THROTTLE:
+                self.throttled += 1
+            return
+        frames = json.loads(data)
+        # 合并发送时一帧是一个数组
+        for frame in frames if isinstance(frames, list) else [frames]:
+            if frame.get("type") == "message":
+                yield frame["message"]
+            elif frame.get("type") == "throttle":
+                self.throttled += 1
+
+    async def _read(self):
+        try:
+            async for data in self.websocket:
+                now = time.perf_counter()
+                for message in self._messages(data):
+                    self.received += 1
+                    self.latencies.append(now - float(message))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def close(self):
+        if self.websocket:
+            await self.websocket.close()
+        if self._reader:
+            await self._reader
+
+
+async def connect_all(clients: list[BenchClient], base_url: str, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(client: BenchClient):
+        async with semaphore:
+            await client.connect(base_url)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connect(client) for client in clients))
+    return time.perf_counter() - start
+
+
+async def send_load(senders: list[BenchClient], rate: float, duration: float) -> int:
+    """按固定节奏轮流让发送者发消息, 落后时不补发, 返回实际发送的条数。"""
+    interval = 1 / rate
+    total = int(rate * duration)
+    start = time.perf_counter()
+    sent = 0
+    for i in range(total):
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await senders[i % len(senders)].send(f"{time.perf_counter():.9f}")
+        sent += 1
+    return sent
+
+
+def expected_deliveries(clients: list[BenchClient], sent: int) -> int:
+    # 自己发的消息自己也会收到; 被限流的消息不会广播
+    return (sent - sum(client.throttled for client in clients)) * len(clients)
+
+
+async def wait_drained(clients: list[BenchClient], sent: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if sum(client.received for client in clients) >= expected_deliveries(clients, sent):
+            return
+        await asyncio.sleep(0.05)
+
+
+async def run(base_url: str, args: argparse.Namespace, server: ProcessStats | None) -> dict:
+    latencies: list[float] = []
+    clients = [BenchClient(i, args.binary, latencies) for i in range(args.clients)]
+    rss_before = server.rss() if server else None
+    connect_seconds = await connect_all(clients, base_url, args.connect_concurrency)
+    # 进房间时的 login 广播是 O(n^2) 的, 等它发完再开始计时
+    await asyncio.sleep(1)
+    rss_after = server.rss() if server else None
+    print(f"Connected {args.clients} clients in {connect_seconds:.1f}s.")
+
+    client_cpu = resource.getrusage(resource.RUSAGE_SELF)
+    server_cpu = server.cpu_seconds() if server else None
+    start = time.perf_counter()
+    sent = await send_load(clients[:max(1, args.senders)], args.rate, args.duration)
+    await wait_drained(clients, sent, args.drain)
+    throttled = sum(client.throttled for client in clients)
+    expected = expected_deliveries(clients, sent)
+    elapsed = time.perf_counter() - start
+    client_usage = resource.getrusage(resource.RUSAGE_SELF)
+    server_cpu_seconds = server.cpu_seconds() - server_cpu if server else None
+
+    for client in clients:
+        await client.close()
+
+    latencies.sort()
+    delivered = len(latencies)
+    result = {
+        "clients": args.clients,
+        "senders": args.senders,
+        "connect_seconds": round(connect_seconds, 3),
+        "sent": sent,
+        "throttled": throttled,
+        "expected": expected,
+        "delivered": delivered,
+        "lost": expected - delivered,
+        "seconds": round(elapsed, 3),
+        "deliveries_per_sec": round(delivered / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "client_cpu_percent": round(
+            (client_usage.ru_utime + client_usage.ru_stime - client_cpu.ru_utime - client_cpu.ru_stime)
+            / elapsed * 100,
+            1,
+        ),
+    }
+    if server:
+        result.update(
+            {
+                "server_rss_mb": round(rss_after / 2**20, 1),
+                "server_kb_per_connection": round((rss_after - rss_before) / args.clients / 1024, 1),
+                "server_cpu_percent": round(server_cpu_seconds / elapsed * 100, 1),
+            }
+        )
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(port: int, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready in time")
+
+
+def serve(args: argparse.Namespace):
+    """子进程: 运行聊天室应用, --fake-redis 时把房间管理器换成用 fakeredis 的实例。"""
+    import uvicorn
+
+    from ..main import app
+
+    if args.fake_redis:
+        import fakeredis
+        from fakeredis import aioredis
+
+        from .. import impl
+        from ..app.routers import room
+        from ..impl import RoomManager
+        from ..impl.codec import msgpack_available
+
+        fake_server = fakeredis.FakeServer()
+        manager = RoomManager(
+            aioredis.FakeRedis(server=fake_server, decode_responses=True),
+            wire_redis=aioredis.FakeRedis(server=fake_server),
+            envelope="msgpack" if msgpack_available() else "json",
+        )
+        # 不需要外部服务: 压测消息不归档, 也不读写当前目录下的 spill 文件 (那是正式服务的)
+        impl.message_archiver.spill_path = None
+        room.room_manager = impl.room_manager = manager
+        app_lifespan = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app):
+            # 应用的 lifespan 关闭的是原来的房间管理器, 替换后的实例在这里关闭
+            async with app_lifespan(app):
+                yield
+                await manager.close()
+
+        app.router.lifespan_context = lifespan
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+async def main(args: argparse.Namespace):
+    if args.binary and msgpack is None:
+        raise SystemExit("--binary needs the msgpack package")
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        server = ProcessStats(args.pid) if args.pid else None
+    else:
+        port = _free_port()
+        base_url = f"ws://127.0.0.1:{port}"
+        command = [sys.executable, "-m", "projects.chatroom.benchmarks.load", "--serve", "--port", str(port)]
+        if args.fake_redis:
+            command.append("--fake-redis")
+        proc = subprocess.Popen(command, env=os.environ.copy(), stdout=subprocess.DEVNULL)
+        server = ProcessStats(proc.pid)
+    try:
+        if proc:
+            await _wait_ready(port, proc)
+        result = await run(base_url, args, server)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+    print(json.dumps(result))
+
+    if args.json_path:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "url": args.url or "uvicorn",
+            "fake_redis": args.fake_redis,
+            "binary": args.binary,
+            "rate": args.rate,
+            "duration": args.duration,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "result": result,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    _args = _parse_args()
+    if _args.serve:
+        serve(_args)
+    else:
+        asyncio.run(main(_args))
@@ -1,6 +1,8 @@
+import hmac
 
 from ...impl import UserRepository
 from ...infra import AuthToeknHelper
+from fastapi_book.infra import password_hasher
 
 from datetime import datetime, timedelta, timezone
 
@@ -20,15 +22,21 @@ class UserService:
             raise ValueError("Phone number already registered")
         user = await self.user_repo.create_user(
             phone_number=phone_number,
-            password=password,
+            password=await password_hasher.hash_password(password),
             username=username
         )
         return user
     
+    async def _check_password(self, password: str, stored: str) -> bool:
+        # 旧数据里存的是明文密码, 兼容比较
+        if not password_hasher.is_hash(stored):
+            return hmac.compare_digest(password.encode(), stored.encode())
+        return await password_hasher.verify_password(password, stored)
+
     async def authenticate_and_issue_token(self, phone_number: str, password: str) -> str:
         """验证用户并签发令牌"""
         user = await self.user_repo.get_user_by_phone(phone_number)
-        if not user or user.password != password:
+        if not user or not await self._check_password(password, user.password):
             raise ValueError("Invalid phone number or password")
         
         data = {
@@ -1,13 +1,54 @@
 
+import os
+
 from .repo.user_repo import UserRepository
 
 
 from .room_manager import RoomManager, Room
-from .schemas import UserInfo
+from .archiver import MessageArchiver
+from .schemas import UserInfo, SlowConsumerPolicy
+
+from ..infra import redis_client, redis_wire_client, SessionLocal
+
+# 正常关闭时还没写进数据库的消息落到 chat_archive_spill.<pid>.<时间>.jsonl, 下次启动时补写
+message_archiver = MessageArchiver(SessionLocal, spill_path="chat_archive_spill.jsonl")
 
-from ..infra import redis_client
+# Redis 信封格式 json / msgpack; 所有节点都能解析两种格式, 全部装好 msgpack 之后再切到 msgpack
+CHAT_ENVELOPE = os.environ.get("CHAT_ENVELOPE", "json")
+# 每个连接的发送队列容量, 队列满时 drop_oldest 丢最旧的帧, disconnect 以 1008 断开
+CHAT_QUEUE_SIZE = int(os.environ.get("CHAT_QUEUE_SIZE", "256"))
+CHAT_SLOW_CONSUMER_POLICY = os.environ.get("CHAT_SLOW_CONSUMER_POLICY", SlowConsumerPolicy.DROP_OLDEST)
+# 合并发送的时间窗口 (秒), 0 表示关闭; 房间每秒消息数达到阈值后才合并
+CHAT_COALESCE_WINDOW = float(os.environ.get("CHAT_COALESCE_WINDOW", "0"))
+CHAT_COALESCE_THRESHOLD = int(os.environ.get("CHAT_COALESCE_THRESHOLD", "100"))
+# 每个连接每秒可发的消息数和突发量; 全集群限流 (每个用户跨节点共用) 为 0 时关闭
+CHAT_RATE_LIMIT = float(os.environ.get("CHAT_RATE_LIMIT", "5"))
+CHAT_RATE_BURST = int(os.environ.get("CHAT_RATE_BURST", "10"))
+CHAT_CLUSTER_RATE_LIMIT = float(os.environ.get("CHAT_CLUSTER_RATE_LIMIT", "0"))
+CHAT_CLUSTER_RATE_BURST = int(os.environ.get("CHAT_CLUSTER_RATE_BURST", "20"))
 
-room_manager = RoomManager(redis_client)
+room_manager = RoomManager(
+    redis_client,
+    queue_size=CHAT_QUEUE_SIZE,
+    slow_consumer_policy=CHAT_SLOW_CONSUMER_POLICY,
+    coalesce_window=CHAT_COALESCE_WINDOW,
+    coalesce_threshold=CHAT_COALESCE_THRESHOLD,
+    wire_redis=redis_wire_client,
+    envelope=CHAT_ENVELOPE,
+    rate_limit=CHAT_RATE_LIMIT,
+    rate_burst=CHAT_RATE_BURST,
+    cluster_rate_limit=CHAT_CLUSTER_RATE_LIMIT or None,
+    cluster_rate_burst=CHAT_CLUSTER_RATE_BURST,
+    archiver=message_archiver,
+)
 
 
-all = ["UserRepository", "RoomManager", "room_manager", "Room", "UserInfo"]
\ No newline at end of file
+all = [
+    "UserRepository",
+    "RoomManager",
+    "room_manager",
+    "Room",
+    "UserInfo",
+    "MessageArchiver",
+    "message_archiver",
+]
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import glob
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .repo.models import Message
+from .schemas import RedisMessage
+
+
+COLUMNS = ["room_name", "message_id", "phone_number", "username", "content", "created_at"]
+
+
+class MessageArchiver:
+    """
+    聊天消息归档到 chatroom.message。
+
+    发布消息时 add() 只把一行追加到内存缓冲, 不等待数据库, 不影响投递; 后台任务攒够 batch_size 行
+    或者每 flush_interval 秒写一次, 每批一条多行 INSERT, asyncpg 驱动下改用 COPY。
+    写库失败时这一批放回缓冲下次重试; 缓冲超过 max_buffer 行时丢弃最旧的。
+
+    应用正常关闭时 stop() 把缓冲全部写完, 仍然写不进去的行写到 spill_path 旁边一个带进程号的
+    文件 (JSON Lines), 多个 worker 互不干扰; 下次 start() 时先把这些文件认领 (rename) 过来读回缓冲,
+    同时启动的 worker 只有一个能认领到同一个文件。
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_buffer: int = 100_000,
+        spill_path: Optional[str] = None,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path
+        self.archived = 0
+        self.dropped = 0
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def add(self, room_name: str, msg: RedisMessage):
+        if len(self._buffer) >= self.max_buffer:
+            self._buffer.popleft()
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"Message archive buffer full, dropped {self.dropped} messages")
+        self._buffer.append(
+            {
+                "room_name": room_name,
+                "message_id": msg.id,
+                "phone_number": msg.user.phone_number,
+                "username": msg.user.username,
+                "content": msg.message,
+                "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            }
+        )
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> bool:
+        """按 batch_size 分批写完缓冲, 全部写入返回 True。"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                try:
+                    await self._write(batch)
+                except Exception as e:
+                    # 放回缓冲最前面, 保持顺序, 下次再试
+                    print(f"Archive {len(batch)} messages failed: {e}")
+                    self._buffer.extendleft(reversed(batch))
+                    return False
+                self.archived += len(batch)
+            return True
+
+    async def _write(self, rows: List[Dict[str, Any]]):
+        async with self.session_factory() as db:
+            conn = await db.connection()
+            if conn.dialect.driver == "asyncpg":
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(
+                    Message.__tablename__,
+                    schema_name=Message.__table__.schema,
+                    columns=COLUMNS,
+                    records=[tuple(row[column] for column in COLUMNS) for row in rows],
+                )
+            else:
+                await conn.execute(insert(Message.__table__), rows)
+            await db.commit()
+
+    async def start(self):
+        self._load_spill()
+        if not self._flush_task:
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if not await self.flush():
+            self._spill()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # shield: 关闭时取消任务不能打断正在进行的写库
+            if not await asyncio.shield(self.flush()):
+                # 数据库不可用时不要每来一条消息就重试一次
+                await asyncio.sleep(self.flush_interval)
+
+    def _spill(self):
+        if not self.spill_path or not self._buffer:
+            return
+        root, ext = os.path.splitext(self.spill_path)
+        path = f"{root}.{os.getpid()}.{time.time_ns()}{ext}"
+        # 先写临时文件再改名, 别的 worker 不会读到写了一半的文件
+        with open(path + ".tmp", "w") as f:
+            for row in self._buffer:
+                f.write(json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n")
+        os.replace(path + ".tmp", path)
+        print(f"Spilled {len(self._buffer)} unarchived messages to {path}")
+        self._buffer.clear()
+
+    def _load_spill(self):
+        if not self.spill_path:
+            return
+        root, ext = os.path.splitext(self.spill_path)
+        rows = []
+        for path in sorted(glob.glob(f"{glob.escape(root)}*{ext}")):
+            claimed = f"{path}.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                # 被同时启动的其它 worker 认领了
+                continue
+            with open(claimed) as f:
+                loaded = [json.loads(line) for line in f if line.strip()]
+            os.remove(claimed)
+            print(f"Loaded {len(loaded)} unarchived messages from {path}")
+            rows.extend(loaded)
+        for row in rows:
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+        # 上次没写进去的排在前面
+        self._buffer.extendleft(reversed(rows))
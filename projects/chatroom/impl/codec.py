@@ -0,0 +1,98 @@
+from typing import Any, List, Optional, Union
+
+from .schemas import RedisMessage, UserInfo, EventType
+
+try:
+    import msgpack
+except ImportError:  # 没有安装 msgpack 时只支持 JSON
+    msgpack = None
+
+
+# 客户端通过 Sec-WebSocket-Protocol 协商的二进制子协议
+SUBPROTOCOL = "chat.msgpack.v1"
+
+# msgpack 信封是 5 个元素的数组: [node, id, phone_number, username, message]
+_ENVELOPE_HEADER = b"\x95"
+
+
+class FrameType:
+    """
+    二进制帧是 msgpack 数组, 第一个元素是类型, 用户用房间内的整数 uid 表示:
+
+    USERS       [0, [[uid, phone_number, username], ...]]   进房间时发一次完整的用户表
+    USER        [1, uid, phone_number, username]             之后出现的新用户
+    MESSAGE     [2, id, uid, message]
+    LOGIN       [3, id, uid]
+    LOGOUT      [4, id, uid]
+    HISTORY_GAP [5, before]
+    THROTTLE    [6, retry_after_ms]                          发送太快, 这条消息没有发出
+    """
+
+    USERS = 0
+    USER = 1
+    MESSAGE = 2
+    LOGIN = 3
+    LOGOUT = 4
+    HISTORY_GAP = 5
+    THROTTLE = 6
+
+
+EVENT_FRAME_TYPES = {
+    EventType.USER_LOGIN: FrameType.LOGIN,
+    EventType.USER_LOGOUT: FrameType.LOGOUT,
+}
+
+# 带消息 id 的帧, 补发历史时按 id 去重
+_FRAMES_WITH_ID = (FrameType.MESSAGE, FrameType.LOGIN, FrameType.LOGOUT)
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def pack(frame: List[Any]) -> bytes:
+    return msgpack.packb(frame)
+
+
+def envelope_prefix(node_id: str) -> bytes:
+    """本节点发布的 msgpack 信封的开头, 和 JSON 的 {"node":... 前缀作用一样。"""
+    return _ENVELOPE_HEADER + msgpack.packb(node_id)
+
+
+def pack_envelope(msg: RedisMessage) -> bytes:
+    return msgpack.packb(
+        [msg.node, msg.id, msg.user.phone_number, msg.user.username, msg.message]
+    )
+
+
+def is_packed(data: Union[str, bytes]) -> bool:
+    return isinstance(data, bytes) and data.startswith(_ENVELOPE_HEADER)
+
+
+def unpack_envelope(data: Union[str, bytes]) -> RedisMessage:
+    """解析 Redis 里的信封, msgpack 和 JSON 两种格式都认, 滚动升级期间可以混用。"""
+    if is_packed(data):
+        if msgpack is None:
+            raise ValueError("received a msgpack envelope but msgpack is not installed")
+        node, id, phone_number, username, message = msgpack.unpackb(data)
+        return RedisMessage(
+            node=node,
+            id=id,
+            user=UserInfo(phone_number=phone_number, username=username),
+            message=message,
+        )
+    return RedisMessage.model_validate_json(data)
+
+
+def packed_frame_id(frame: bytes) -> Optional[str]:
+    obj = msgpack.unpackb(frame)
+    return obj[1] if obj[0] in _FRAMES_WITH_ID else None
+
+
+def unpack_client_message(data: bytes) -> Optional[str]:
+    """二进制客户端发来的聊天内容是 msgpack 编码的字符串, 格式不对时返回 None。"""
+    try:
+        message = msgpack.unpackb(data)
+    except Exception:
+        return None
+    return message if isinstance(message, str) else None
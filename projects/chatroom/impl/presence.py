@@ -0,0 +1,128 @@
+import time
+from typing import Any, Dict, List
+
+from redis.asyncio import Redis
+
+
+# 占用会话: 成员仍然在线 (分数没过期) 且属于别的节点时拒绝, 否则写入分数、归属和用户名
+_CLAIM_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) > tonumber(ARGV[4]) then
+    local owner = redis.call('HGET', KEYS[2], ARGV[1])
+    if owner and owner ~= ARGV[2] then
+        return 0
+    end
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[5])
+return 1
+"""
+
+# 释放会话: 只删除自己节点持有的
+_RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# 批量清理心跳超时的成员, 连同归属和用户名一起删掉
+_EXPIRE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+    redis.call('HDEL', KEYS[2], unpack(expired))
+    redis.call('HDEL', KEYS[3], unpack(expired))
+end
+return #expired
+"""
+
+
+class RoomPresence:
+    """
+    基于 Redis 有序集合的全集群在线状态。
+
+    每个房间一个 ZSET (成员是手机号, 分数是最后一次心跳的毫秒时间戳), 另有两个 hash 记录
+    会话归属的节点和用户名。分数在 ttl 之内的成员视为在线, 在线人数和在线列表都是 O(log n) 的
+    范围查询。同一个手机号在一个房间里同时只能有一个会话, 由 Lua 脚本原子地判断和占用。
+    """
+
+    def __init__(self, redis: Redis, node_id: str, ttl: float = 30.0, expire_batch: int = 1000):
+        self.redis = redis
+        self.node_id = node_id
+        self.ttl = ttl
+        self.expire_batch = expire_batch
+        self._claim = redis.register_script(_CLAIM_SCRIPT)
+        self._release = redis.register_script(_RELEASE_SCRIPT)
+        self._expire = redis.register_script(_EXPIRE_SCRIPT)
+
+    @staticmethod
+    def _keys(room_name: str) -> List[str]:
+        key = f"chat:presence:{room_name}"
+        return [key, f"{key}:owner", f"{key}:name"]
+
+    def _cutoff(self, now_ms: int) -> int:
+        return now_ms - int(self.ttl * 1000)
+
+    async def claim(self, room_name: str, phone_number: str, username: str) -> bool:
+        now_ms = int(time.time() * 1000)
+        result = await self._claim(
+            keys=self._keys(room_name),
+            args=[phone_number, self.node_id, now_ms, self._cutoff(now_ms), username],
+        )
+        return bool(result)
+
+    async def release(self, room_name: str, phone_number: str):
+        await self._release(keys=self._keys(room_name), args=[phone_number, self.node_id])
+
+    async def heartbeat(self, room_name: str, members: Dict[str, str]) -> List[str]:
+        """
+        给本节点的成员续期, members 是 手机号 -> 用户名。
+
+        续期和占用是同一个脚本, 一个房间的所有成员用一个 pipeline 发出; 返回已经被别的节点
+        占用的成员 (本节点心跳中断太久才会发生), 调用方应该断开它们。
+        """
+        if not members:
+            return []
+        now_ms = int(time.time() * 1000)
+        keys = self._keys(room_name)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for phone_number, username in members.items():
+                await self._claim(
+                    keys=keys,
+                    args=[phone_number, self.node_id, now_ms, self._cutoff(now_ms), username],
+                    client=pipe,
+                )
+            results = await pipe.execute()
+        return [phone_number for phone_number, ok in zip(members, results) if not ok]
+
+    async def expire(self, room_name: str) -> int:
+        """删除心跳超时的成员, 每次最多 expire_batch 个。"""
+        now_ms = int(time.time() * 1000)
+        return await self._expire(
+            keys=self._keys(room_name), args=[self._cutoff(now_ms), self.expire_batch]
+        )
+
+    async def online_count(self, room_name: str) -> int:
+        key = self._keys(room_name)[0]
+        return await self.redis.zcount(key, self._cutoff(int(time.time() * 1000)), "+inf")
+
+    async def online_users(
+        self, room_name: str, offset: int = 0, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """按最近心跳从新到旧分页列出在线成员。"""
+        key, _, name_key = self._keys(room_name)
+        phone_numbers = await self.redis.zrevrangebyscore(
+            key, "+inf", self._cutoff(int(time.time() * 1000)), start=offset, num=limit
+        )
+        if not phone_numbers:
+            return []
+        usernames = await self.redis.hmget(name_key, phone_numbers)
+        return [
+            {"phone_number": phone_number, "username": username}
+            for phone_number, username in zip(phone_numbers, usernames)
+        ]
@@ -0,0 +1,77 @@
+import math
+import time
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+
+# 令牌桶: hash 里存剩余令牌数和上次更新的毫秒时间, 用 Redis 的时钟, 各节点之间不受时钟偏差影响
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return retry
+"""
+
+
+class TokenBucket:
+    """进程内的令牌桶, 每秒补充 rate 个令牌, 最多攒 burst 个。"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def acquire(self) -> float:
+        """取一个令牌, 成功返回 0, 否则返回还要等待的秒数。"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ClusterRateLimiter:
+    """
+    全集群的令牌桶, 同一个用户在所有节点上共用一个桶。
+
+    每次检查是一次 Lua 脚本调用, 所以只在进程内的令牌桶放行之后才检查;
+    Redis 不可用时放行, 不因为限流把聊天整个停掉。
+    """
+
+    def __init__(self, redis: Redis, rate: float, burst: int):
+        self.redis = redis
+        self.rate = rate
+        self.burst = burst
+        self._script = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, key: str) -> float:
+        """取一个令牌, 成功返回 0, 否则返回还要等待的秒数。"""
+        try:
+            retry_ms = await self._script(
+                keys=[f"chat:ratelimit:{key}"], args=[self.rate, self.burst]
+            )
+        except RedisError as e:
+            print(f"Cluster rate limit for {key} failed: {e}")
+            return 0.0
+        return int(retry_ms) / 1000 if retry_ms else 0.0
+
+
+def retry_after_ms(seconds: float) -> int:
+    return max(1, math.ceil(seconds * 1000))
@@ -1,5 +1,5 @@
 from ...infra import Base
-from sqlalchemy import Column, String, DateTime, func, Integer 
+from sqlalchemy import Column, String, DateTime, func, Integer, BigInteger, Text, Index
 
 
 class User(Base):
@@ -11,9 +11,29 @@ class User(Base):
     phone_number = Column(String(20))
     # 用户姓名
     username = Column(String(20))
-    # 用户密码
-    password = Column(String(32))
+    # 用户密码 (bcrypt 哈希)
+    password = Column(String(128))
     # 用户创建时间
     created_at = Column(DateTime(), default=func.now())
 
 
+class Message(Base):
+    # 归档的聊天消息, 由 MessageArchiver 批量写入
+    __tablename__ = 'message'
+    __table_args__ = (
+        Index('ix_chatroom_message_room_created_at', 'room_name', 'created_at'),
+        {'schema': 'chatroom'},
+    )
+    # SQLite 只有 INTEGER 主键会自增
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    # 房间名
+    room_name = Column(String(64), nullable=False)
+    # Redis 历史流里的消息 id, 没有 Redis 时为空
+    message_id = Column(String(32))
+    # 发送者
+    phone_number = Column(String(20), nullable=False)
+    username = Column(String(20))
+    # 消息内容
+    content = Column(Text)
+    # 发布时间 (UTC)
+    created_at = Column(DateTime(), nullable=False)
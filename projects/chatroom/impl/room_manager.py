@@ -1,21 +1,158 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, Set, Tuple, Union
 
 from redis.asyncio import Redis
 
 from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError, TimeoutError as RedisTimeoutError
 import asyncio
+import json
+import os
+import socket
+import time
+import uuid
 from typing import List
 from fastapi import WebSocket
 from typing import Any
 
-from .schemas import UserInfo, RedisMessage, EventType, UserConnection
+from .schemas import UserInfo, RedisMessage, EventType, UserConnection, SlowConsumerPolicy
+from .presence import RoomPresence
+from .rate_limit import ClusterRateLimiter, TokenBucket, retry_after_ms
+from .archiver import MessageArchiver
+from .codec import (
+    EVENT_FRAME_TYPES,
+    FrameType,
+    envelope_prefix,
+    is_packed,
+    msgpack_available,
+    pack,
+    pack_envelope,
+    packed_frame_id,
+    unpack_envelope,
+)
+
+
+# 下发给客户端的聊天帧的开头
+_CHAT_FRAME_PREFIX = '{"type":"message",'
+
+
+def chat_frame(payload: str) -> Optional[str]:
+    """
+    把聊天消息的 Redis payload 直接改写成下发给客户端的帧, 不解析也不重新编码。
+
+    payload 形如 {"node": ..., "id": ..., "user": ..., "message": ...}, 去掉 node、补上 type 即可;
+    不是预期的格式时返回 None, 由调用方走解析的路径。
+    """
+    if payload.startswith('{"user":'):
+        return _CHAT_FRAME_PREFIX + payload[1:]
+    if payload.startswith('{"node":'):
+        # node_id 里不会出现 ," , 第一个 ," 就是下一个字段的开头
+        index = payload.find(',"', len('{"node":'))
+        if index > 0:
+            return _CHAT_FRAME_PREFIX + payload[index + 1:]
+    return None
+
+
+def _dumps(frame: Dict[str, Any]) -> str:
+    return json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+
+
+def _text(value: Union[str, bytes]) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
 
 
 class RoomManager:
+    """
+    管理本进程的所有房间。
+
+    整个进程只用一个 PubSub 连接, 以模式订阅 chat:room:* 并阻塞在 listen() 上,
+    收到的消息按 channel 查表分发给对应房间。第一个房间创建时才开始订阅,
+    最后一个房间关闭时取消订阅并释放连接。
+
+    queue_size / slow_consumer_policy 是每个连接发送队列的容量和队列满时的处理方式。
 
-    def __init__(self, redis: Redis):
+    本节点用户发的消息写进历史流拿到 id 之后, 先直接投递给本节点的房间成员, 再带上 node_id
+    发布到 Redis; 监听时跳过 node_id 是自己的消息, 同一条消息不会投递两次。
+
+    每个房间的消息和事件同时写进一个 Redis Stream (最多保留约 history_maxlen 条),
+    客户端带 last_id 重连时补发最多 catchup_limit 条。
+
+    在线状态记录在 Redis 里 (见 RoomPresence), 本节点每 heartbeat_interval 秒给自己的成员续期,
+    并清理心跳超时的成员; 同一个用户在一个房间里全集群只能有一个会话。
+
+    coalesce_window 大于 0 时房间默认打开合并发送 (见 Room), 0 表示关闭。
+
+    给出 decode_responses=False 的 wire_redis 时 pub/sub 和历史流都走这个连接, 收到的 payload
+    不管是 JSON 还是 msgpack 都能解析。envelope="msgpack" 时本节点发布的信封用 msgpack 编码,
+    需要安装 msgpack 并且有 wire_redis; 集群里所有节点都装了 msgpack 之后才应该打开。
+
+    发消息限流: 每个连接一个进程内的令牌桶 (每秒补充 rate_limit 个, 最多攒 rate_burst 个,
+    rate_limit 为 0 时不限); 给出 cluster_rate_limit 时再用 Redis 里的令牌桶限制同一个用户在
+    全集群的发送速度。超限的消息不发布, 只给发送者回一个 throttle 帧。
+
+    传入 archiver 时, 本节点用户发的聊天消息在发布时交给它归档, 每条消息只在发出的节点归档一次。
+    """
+
+    CHANNEL_PATTERN = "chat:room:*"
+
+    def __init__(
+        self,
+        redis: Redis,
+        queue_size: int = 256,
+        slow_consumer_policy: str = SlowConsumerPolicy.DROP_OLDEST,
+        node_id: Optional[str] = None,
+        history_maxlen: int = 10000,
+        catchup_limit: int = 200,
+        presence_ttl: float = 30.0,
+        heartbeat_interval: float = 10.0,
+        coalesce_window: float = 0.0,
+        coalesce_max_batch: int = 50,
+        coalesce_threshold: int = 100,
+        wire_redis: Optional[Redis] = None,
+        envelope: str = "json",
+        rate_limit: float = 5.0,
+        rate_burst: int = 10,
+        cluster_rate_limit: Optional[float] = None,
+        cluster_rate_burst: int = 20,
+        archiver: Optional[MessageArchiver] = None,
+    ):
         self.redis = redis
+        self.archiver = archiver
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.cluster_limiter: Optional[ClusterRateLimiter] = (
+            ClusterRateLimiter(redis, cluster_rate_limit, cluster_rate_burst)
+            if redis and cluster_rate_limit
+            else None
+        )
+        self.packed_envelope = envelope == "msgpack" and msgpack_available() and wire_redis is not None
+        if envelope == "msgpack" and not self.packed_envelope:
+            print("msgpack envelope needs the msgpack package and a binary wire_redis, using JSON")
+        # pub/sub 和历史流用的连接; 不解码的连接才能同时收 JSON 和 msgpack 两种信封
+        self.wire: Redis = wire_redis or redis
+        self.heartbeat_interval = heartbeat_interval
+        self.history_maxlen = history_maxlen
+        self.catchup_limit = catchup_limit
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # 本节点发布的 payload 的开头, 监听时据此跳过, 不必解析; wire 是否解码决定收到的是 str 还是 bytes
+        self._own_prefix = f'{{"node":{json.dumps(self.node_id)},'
+        self._own_prefix_bytes = (
+            envelope_prefix(self.node_id) if self.packed_envelope else self._own_prefix.encode("utf-8")
+        )
+        self.presence: Optional[RoomPresence] = (
+            RoomPresence(redis, self.node_id, ttl=presence_ttl) if redis else None
+        )
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_batch = coalesce_max_batch
+        self.coalesce_threshold = coalesce_threshold
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
         self.rooms: Dict[str, Room] = {}
+        self._channels: Dict[str, Room] = {}
+        self._pubsub: Optional[PubSub] = None
+        self._listen_task: Optional[asyncio.Task] = None
+        # 启动和停止监听都要等 Redis, 串行执行, 避免最后一个房间关闭时把新房间刚建好的订阅关掉
+        self._listener_lock = asyncio.Lock()
 
     async def get_room(self, room_name: str) -> "Room":
         room: Optional[Room] = self.rooms.get(room_name)
@@ -31,16 +168,164 @@ class RoomManager:
             await room.destroy()
             print(f"Room {room_name} closed and cleaned up.")
 
+    def stats(self) -> Dict[str, Any]:
+        return {room_name: room.stats() for room_name, room in self.rooms.items()}
+
+    async def history(
+        self, room_name: str, before: Optional[str] = None, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        # 查询历史不需要房间在本节点上有成员, 临时的 Room 不会注册
+        room = self.rooms.get(room_name) or Room(self, room_name)
+        return await room.history(before=before, limit=limit)
+
+    def encode_envelope(self, msg: RedisMessage) -> Union[str, bytes]:
+        return pack_envelope(msg) if self.packed_envelope else msg.model_dump_json()
+
+    async def online(self, room_name: str, offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+        """房间的在线人数和在线列表; 没有 Redis 时只有本节点的成员。"""
+        if self.presence:
+            return {
+                "count": await self.presence.online_count(room_name),
+                "users": await self.presence.online_users(room_name, offset=offset, limit=limit),
+            }
+        room = self.rooms.get(room_name)
+        users = list(room._users.values()) if room else []
+        return {
+            "count": len(users),
+            "users": [
+                {"phone_number": user.phone_number, "username": user.username}
+                for user in users[offset:offset + limit]
+            ],
+        }
+
+    async def register(self, room: "Room"):
+        for channel in room.channels:
+            self._channels[channel] = room
+        await self._start_listener()
+
+    async def unregister(self, room: "Room"):
+        for channel in room.channels:
+            if self._channels.get(channel) is room:
+                del self._channels[channel]
+        if not self._channels:
+            await self._stop_listener()
+
+    async def _start_listener(self):
+        async with self._listener_lock:
+            if self._listen_task or not self.redis or not self._channels:
+                return
+            pubsub = self.wire.pubsub(ignore_subscribe_messages=True)
+            await pubsub.psubscribe(self.CHANNEL_PATTERN)
+            self._pubsub = pubsub
+            self._listen_task = asyncio.create_task(self._listen(pubsub))
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _stop_listener(self):
+        async with self._listener_lock:
+            if self._channels:
+                # 等锁期间又有房间注册, 继续使用现有的订阅
+                return
+            # 先取出并清空, 之后的 await 期间看到的都是已经停止的状态
+            pubsub, self._pubsub = self._pubsub, None
+            tasks = (self._listen_task, self._heartbeat_task)
+            self._listen_task = self._heartbeat_task = None
+            for task in tasks:
+                if task:
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+            if pubsub:
+                await pubsub.punsubscribe(self.CHANNEL_PATTERN)
+                await pubsub.aclose()
+
+    async def _listen(self, pubsub: PubSub):
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage" or self._is_own(message["data"]):
+                        continue
+                    channel = _text(message["channel"])
+                    room = self._channels.get(channel)
+                    if room:
+                        try:
+                            await room._handle_message(channel, message["data"])
+                        except Exception as e:
+                            # 一条处理不了的消息不能让整个监听任务退出
+                            print(f"Drop message on {channel}: {e!r}")
+                        # 让出事件循环, 连续到达的消息不会饿死各连接的写任务
+                        await asyncio.sleep(0)
+            except (RedisTimeoutError, TimeoutError):
+                # 空闲时读超时, 继续阻塞等待
+                continue
+            except RedisError as e:
+                # 重连后 redis-py 会自动恢复模式订阅
+                print(f"Room listener error: {e}")
+                await asyncio.sleep(1)
+            except Exception as e:
+                print(f"Room listener error: {e!r}")
+                await asyncio.sleep(1)
+
+    def _is_own(self, data: Union[str, bytes]) -> bool:
+        if isinstance(data, bytes):
+            return data.startswith(self._own_prefix_bytes)
+        return data.startswith(self._own_prefix)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for room in list(self.rooms.values()):
+                try:
+                    members = {phone: c.username for phone, c in room._users.items()}
+                    for phone_number in await self.presence.heartbeat(room.room_name, members):
+                        # 心跳中断期间会话被别的节点接管了, 断开本地这一份
+                        connection = room._users.get(phone_number)
+                        if connection:
+                            await connection.disconnect(1008, "session taken over")
+                    await self.presence.expire(room.room_name)
+                except RedisError as e:
+                    print(f"Presence heartbeat for room {room.room_name} failed: {e}")
+
+    async def close(self):
+        for room_name in list(self.rooms):
+            await self.close_room(room_name)
+        await self._stop_listener()
+
 
 class Room:
+    """
+    一个聊天房间。
+
+    合并发送 (coalesce_window > 0 时打开): 房间每秒的消息数达到 coalesce_threshold 后,
+    把 coalesce_window 秒内或者凑满 coalesce_max_batch 条的帧拼成一个 JSON 数组一次发给每个连接,
+    减少帧数和系统调用; 流量低于阈值时仍然逐条立即发送。只作用于 JSON 连接。
+
+    二进制 (msgpack) 连接进房间时先收到一份用户表, 之后的帧只带用户的整数 uid;
+    房间里出现新用户时先给所有二进制连接发一帧 USER。
+    """
 
     def __init__(self, room_manager: "RoomManager", room_name: str):
         self.room_name: str = room_name
         self.room_manager: RoomManager = room_manager
-        self.redis: Redis = room_manager.redis
-        self.pubsub: Optional[PubSub] = None
+        self.redis: Redis = room_manager.wire
         self._users: Dict[str, UserConnection] = {}
-        self._listen_task: Optional[asyncio.Task] = None
+        # 正在 login 里等待占用会话的用户; 房间有人在进来时不会被关闭
+        self._joining: Set[str] = set()
+        # 二进制连接数, 没有时不做 msgpack 编码
+        self._binary: int = 0
+        # 手机号 -> (uid, 用户名)
+        self._uids: Dict[str, Tuple[int, str]] = {}
+        self.coalesce_window: float = room_manager.coalesce_window
+        self.coalesce_max_batch: int = room_manager.coalesce_max_batch
+        self.coalesce_threshold: int = room_manager.coalesce_threshold
+        self.batches: int = 0
+        self._batch: List[str] = []
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+        # 按秒统计的消息数: 当前这一秒和上一秒
+        self._rate_second: int = 0
+        self._rate_count: int = 0
+        self._rate_last: int = 0
 
     @property
     def event_channel(self) -> str:
@@ -50,99 +335,303 @@ class Room:
     def chat_channel(self) -> str:
         return f"chat:room:{self.room_name}:msg"
 
+    @property
+    def history_key(self) -> str:
+        # 不用 chat:room: 前缀, 和频道名区分开
+        return f"chat:history:{self.room_name}"
+
+    @property
+    def channels(self) -> List[str]:
+        return [self.chat_channel, self.event_channel]
+
     @property
     def active_connections(self) -> List[WebSocket]:
         return [user.websocket for user in self._users.values()]
 
+    def stats(self) -> Dict[str, Any]:
+        """发送队列深度和丢帧数, 用来发现慢客户端。"""
+        connections = list(self._users.values())
+        return {
+            "members": len(connections),
+            "queued": sum(c.queue_depth for c in connections),
+            "max_queue_depth": max((c.queue_depth for c in connections), default=0),
+            "sent": sum(c.sent for c in connections),
+            "dropped": sum(c.dropped for c in connections),
+            "closed": sum(1 for c in connections if c.closed),
+            "batches": self.batches,
+            "binary": self._binary,
+            "throttled": sum(c.throttled for c in connections),
+        }
+
+    def _broadcast_text(self, text: str):
+        if self.coalesce_window > 0:
+            # 每条消息都要计数, 不能因为已经有批次就跳过, 否则速率被低估, 合并提前结束
+            busy = self._busy()
+            if self._batch or busy:
+                self._coalesce(text)
+                return
+        self._send_all(text)
+
+    def _send_all(self, text: str):
+        # 整个房间共用同一份编码好的帧; 只入队不等待, 各连接的写任务负责真正发送
+        for connection in self._users.values():
+            if not connection.binary:
+                connection.send(text)
+
+    def _send_binary(self, frame: bytes):
+        for connection in self._users.values():
+            if connection.binary:
+                connection.send(frame)
+
+    def _busy(self) -> bool:
+        """记一条消息, 返回当前这一秒或上一秒的消息数是否达到合并发送的阈值。"""
+        second = int(time.monotonic())
+        if second != self._rate_second:
+            self._rate_last = self._rate_count if second == self._rate_second + 1 else 0
+            self._rate_second, self._rate_count = second, 0
+        self._rate_count += 1
+        return max(self._rate_count, self._rate_last) >= self.coalesce_threshold
+
+    def _coalesce(self, text: str):
+        # 有未发出的批次时新帧也进批次, 保证顺序
+        self._batch.append(text)
+        if len(self._batch) >= self.coalesce_max_batch:
+            self._flush_batch()
+        elif not self._batch_timer:
+            self._batch_timer = asyncio.get_running_loop().call_later(
+                self.coalesce_window, self._flush_batch
+            )
+
+    def _flush_batch(self):
+        if self._batch_timer:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self.batches += 1
+        # 每一帧都已经是 JSON 文本, 直接拼成数组, 不重新编码
+        self._send_all(batch[0] if len(batch) == 1 else "[" + ",".join(batch) + "]")
+
     async def setup(self):
         print(f"Setting up room: {self.room_name}")
-        self.destroy()
-        self.pubsub = self.redis.pubsub()
-        await self.pubsub.subscribe(self.chat_channel, self.event_channel)
-
-        async def listen(pubsub: PubSub):
-            while True:
-                message = await pubsub.get_message(
-                    ignore_subscribe_messages=True, timeout=1.0
-                )
-                if message:
-                    await self._handle_message(message)
-                await asyncio.sleep(0.01)  # Prevent busy-waiting
-
-        self._listen_task = asyncio.create_task(listen(self.pubsub))
-
-    def destroy(self):
-        if self._listen_task:
-            self._listen_task.cancel()
-            self._listen_task = None
-        if self.pubsub:
-            self.pubsub.unsubscribe(self.chat_channel, self.event_channel)
-            self.pubsub.close()
-
-    async def _handle_message(self, message: Any):
-        print(f"Received message: {message}")
-        if not message or message["type"] != "message":
-            return
-        data = message["data"]
-        channel = message["channel"]
+        await self.room_manager.register(self)
 
+    async def destroy(self):
+        self._flush_batch()
+        await self.room_manager.unregister(self)
+
+    async def _handle_message(self, channel: str, data: Any):
         # Convert bytes to string if necessary
         if isinstance(channel, bytes):
             channel = channel.decode("utf-8")
-        if isinstance(data, bytes):
+        if isinstance(data, bytes) and not is_packed(data):
             data = data.decode("utf-8")
 
-        print(f"Processing channel: {channel}, data: {data}")
-
         try:
-            msg = RedisMessage.model_validate_json(data)
-            if channel == self.chat_channel:
-                await self._broadcast_user_message(msg.user, msg.message)
-            elif channel == self.event_channel:
-                await self._broadcast_user_event(msg.user, msg.message)
-            else:
-                print(f"Unknown channel: {channel}")
+            # 每种编码每条消息只编码一次
+            msg = None
+            if self._binary:
+                msg = unpack_envelope(data)
+                packed = self._packed_frame(channel, msg)
+                if packed:
+                    self._send_binary(packed)
+            if len(self._users) > self._binary:
+                frame = self._frame(channel, data, msg)
+                if frame:
+                    self._broadcast_text(frame)
         except Exception as e:
             print(f"Error processing message: {e}")
 
-    async def _broadcast_user_message(self, user: UserInfo, message: str):
-        for connection in self.active_connections:
-            await connection.send_json(
-                {
-                    "type": "message",
-                    "user": {
-                        "phone_number": user.phone_number,
-                        "username": user.username,
-                    },
-                    "message": message,
-                }
-            )
+    def _frame(
+        self,
+        channel: str,
+        data: Union[str, bytes, None] = None,
+        msg: Optional[RedisMessage] = None,
+    ) -> Optional[str]:
+        """把 Redis payload (或者已经解析好的 msg) 转成下发给客户端的帧文本。"""
+        if isinstance(data, str) and channel == self.chat_channel:
+            frame = chat_frame(data)
+            if frame:
+                return frame
+        msg = msg or unpack_envelope(data)
+        if channel == self.chat_channel:
+            return _dumps(self._message_frame(msg))
+        if channel == self.event_channel:
+            return _dumps(self._event_frame(msg))
+        print(f"Unknown channel: {channel}")
+        return None
+
+    def _message_frame(self, msg: RedisMessage) -> Dict[str, Any]:
+        return {
+            "type": "message",
+            "id": msg.id,
+            "user": {
+                "phone_number": msg.user.phone_number,
+                "username": msg.user.username,
+            },
+            "message": msg.message,
+        }
 
-    async def _broadcast_user_event(self, user: UserInfo, event: str):
+    def _event_frame(self, msg: RedisMessage) -> Dict[str, Any]:
+        user, event = msg.user, msg.message
         if event == EventType.USER_LOGIN:
             message = f"{user.username} has joined the room."
         elif event == EventType.USER_LOGOUT:
             message = f"{user.username} has left the room."
         else:
             message = f"Unknown event {event} for user {user.username}."
-        for connection in self.active_connections:
-            await connection.send_json(
-                {
-                    "type": event,
-                    "user": {
-                        "phone_number": user.phone_number,
-                        "username": user.username,
-                    },
-                    "message": message,
-                }
+        return {
+            "type": event,
+            "id": msg.id,
+            "user": {
+                "phone_number": user.phone_number,
+                "username": user.username,
+            },
+            "message": message,
+        }
+
+    def _uid(self, user: UserInfo) -> int:
+        entry = self._uids.get(user.phone_number)
+        if entry and entry[1] == user.username:
+            return entry[0]
+        uid = entry[0] if entry else len(self._uids)
+        self._uids[user.phone_number] = (uid, user.username)
+        # 之后的帧会引用这个 uid, 先告诉所有二进制连接; 没有二进制连接时不编码, 也不需要 msgpack
+        if self._binary and msgpack_available():
+            self._send_binary(pack([FrameType.USER, uid, user.phone_number, user.username]))
+        return uid
+
+    def _users_frame(self) -> bytes:
+        """进房间时发给二进制连接的完整用户表, 包括当前所有成员。"""
+        for connection in self._users.values():
+            self._uid(connection)
+        return pack(
+            [
+                FrameType.USERS,
+                [[uid, phone, username] for phone, (uid, username) in self._uids.items()],
+            ]
+        )
+
+    def _packed_frame(self, channel: str, msg: RedisMessage) -> Optional[bytes]:
+        if channel == self.chat_channel:
+            return pack([FrameType.MESSAGE, msg.id, self._uid(msg.user), msg.message])
+        frame_type = EVENT_FRAME_TYPES.get(msg.message) if channel == self.event_channel else None
+        if frame_type is None:
+            return None
+        return pack([frame_type, msg.id, self._uid(msg.user)])
+
+    def _history_frames(
+        self, entries: List[Tuple[Any, Dict[Any, Any]]], binary: bool = False
+    ) -> List[Tuple[str, Union[str, bytes]]]:
+        """把 stream 里的条目转成 (id, 帧), 条目本身存的 payload 里还没有 id。"""
+        frames = []
+        for entry_id, fields in entries:
+            entry_id = _text(entry_id)
+            try:
+                channel = _text(fields["c"] if "c" in fields else fields[b"c"])
+                msg = unpack_envelope(fields["p"] if "p" in fields else fields[b"p"])
+                msg.id = entry_id
+                if binary:
+                    frame = self._packed_frame(channel, msg)
+                else:
+                    frame = self._frame(channel, msg=msg)
+            except Exception as e:
+                print(f"Skip history entry {entry_id}: {e}")
+                continue
+            if frame:
+                frames.append((entry_id, frame))
+        return frames
+
+    async def history(self, before: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """从新到旧分页读取历史, before 是上一页最早一条的 id; 返回按时间正序排列。"""
+        if not self.redis:
+            return []
+        entries = await self.redis.xrevrange(
+            self.history_key, max=f"({before}" if before else "+", min="-", count=limit
+        )
+        entries.reverse()
+        return [json.loads(frame) for _, frame in self._history_frames(entries)]
+
+    async def _catch_up(
+        self, last_id: str, binary: bool = False
+    ) -> Tuple[List[Union[str, bytes]], set]:
+        """
+        取 last_id 之后的消息用于补发, 返回 (帧列表, 消息 id 集合)。
+
+        超过 catchup_limit 条时只补最近的, 并在最前面告诉客户端有缺口。
+        """
+        limit = self.room_manager.catchup_limit
+        try:
+            entries = await self.redis.xrevrange(
+                self.history_key, max="+", min=f"({last_id}", count=limit
             )
+        except RedisError as e:
+            print(f"Catch up from {last_id} failed: {e}")
+            return [], set()
+        entries.reverse()
+        frames = self._history_frames(entries, binary=binary)
+        texts = [frame for _, frame in frames]
+        if len(entries) >= limit:
+            # 更早的消息通过历史接口分页获取
+            before = _text(entries[0][0])
+            texts.insert(
+                0,
+                pack([FrameType.HISTORY_GAP, before])
+                if binary
+                else _dumps({"type": "history_gap", "before": before}),
+            )
+        return texts, {entry_id for entry_id, _ in frames}
 
-    async def login(self, user: UserInfo, websocket: WebSocket) -> bool:
-        if user.phone_number in self._users:
+    async def login(
+        self,
+        user: UserInfo,
+        websocket: WebSocket,
+        last_id: Optional[str] = None,
+        binary: bool = False,
+    ) -> bool:
+        if user.phone_number in self._users or user.phone_number in self._joining:
             return False
-        self._users[user.phone_number] = UserConnection(
-            phone_number=user.phone_number, username=user.username, websocket=websocket
+        presence = self.room_manager.presence
+        if presence:
+            # 先同步占住位置, 等待 Redis 期间最后一个成员离开也不会关闭这个房间
+            self._joining.add(user.phone_number)
+            try:
+                claimed = await presence.claim(self.room_name, user.phone_number, user.username)
+            finally:
+                self._joining.discard(user.phone_number)
+            if not claimed:
+                # 同一个用户已经在别的节点上在线
+                await self._close_if_empty()
+                return False
+        connection = UserConnection(
+            phone_number=user.phone_number,
+            username=user.username,
+            websocket=websocket,
+            queue_size=self.room_manager.queue_size,
+            policy=self.room_manager.slow_consumer_policy,
+            binary=binary,
+            bucket=(
+                TokenBucket(self.room_manager.rate_limit, self.room_manager.rate_burst)
+                if self.room_manager.rate_limit
+                else None
+            ),
         )
+        # 登记之前分配 uid, USER 帧只发给房间里已有的二进制连接
+        self._uid(user)
+        # 先登记再补发历史, 补发期间到达的实时消息排在队列里, 不会漏
+        self._users[user.phone_number] = connection
+        if binary:
+            self._binary += 1
+        frames, ids = [], set()
+        if last_id and self.redis:
+            frames, ids = await self._catch_up(last_id, binary=binary)
+        if binary:
+            # 用户表放在最前面, 后面的帧都引用其中的 uid
+            frames.insert(0, self._users_frame())
+        if frames:
+            connection.replay(frames, ids, packed_id=packed_frame_id)
+        connection.start()
         await self._pubs_user_event(
             UserInfo(phone_number=user.phone_number, username=user.username),
             EventType.USER_LOGIN,
@@ -155,17 +644,71 @@ class Room:
                 UserInfo(phone_number=user.phone_number, username=user.username),
                 EventType.USER_LOGOUT,
             )
-            del self._users[user.phone_number]
+            connection = self._users.pop(user.phone_number)
+            if connection.binary:
+                self._binary -= 1
+            await connection.close()
+            if self.room_manager.presence:
+                await self.room_manager.presence.release(self.room_name, user.phone_number)
+            await self._close_if_empty()
 
-    async def send_message(self, user: UserInfo, message: str):
+    async def _close_if_empty(self):
+        # 最后一个人离开后关闭房间, 不再接收这个房间的消息
+        if not self._users and not self._joining and self.room_manager.rooms.get(self.room_name) is self:
+            await self.room_manager.close_room(self.room_name)
+
+    async def send_message(self, user: UserInfo, message: str) -> bool:
+        """发布一条聊天消息; 发送太快时不发布, 给发送者回一个 throttle 帧并返回 False。"""
         connection = self._users.get(user.phone_number)
-        if connection:
-            await self._pub_user_message(connection, message)
+        if not connection:
+            return False
+        retry_after = await self._acquire(connection)
+        if retry_after:
+            connection.throttled += 1
+            connection.send(self._throttle_frame(connection, retry_after))
+            return False
+        await self._pub_user_message(
+            UserInfo(phone_number=connection.phone_number, username=connection.username),
+            message,
+        )
+        return True
+
+    async def _acquire(self, connection: UserConnection) -> float:
+        # 先查本地的桶, 被拒绝的消息不会再去访问 Redis
+        if connection.bucket:
+            retry_after = connection.bucket.acquire()
+            if retry_after:
+                return retry_after
+        limiter = self.room_manager.cluster_limiter
+        if limiter:
+            return await limiter.acquire(connection.phone_number)
+        return 0.0
+
+    def _throttle_frame(self, connection: UserConnection, retry_after: float) -> Union[str, bytes]:
+        retry_ms = retry_after_ms(retry_after)
+        if connection.binary:
+            return pack([FrameType.THROTTLE, retry_ms])
+        return _dumps({"type": "throttle", "retry_after_ms": retry_ms})
 
     async def _pub_message(self, channel: str, user: UserInfo, message: str):
+        msg = RedisMessage(node=self.room_manager.node_id, user=user, message=message)
+        if self.redis:
+            # 先写进历史流, 用 stream 的 id 作为消息 id, 所有客户端 (包括本节点的) 重连时凭它补发;
+            # 本节点的成员只等这一次 XADD, 不等 pub/sub 往返
+            msg.id = _text(
+                await self.redis.xadd(
+                    self.history_key,
+                    {"c": channel, "p": self.room_manager.encode_envelope(msg)},
+                    maxlen=self.room_manager.history_maxlen,
+                    approximate=True,
+                )
+            )
+        if channel == self.chat_channel and self.room_manager.archiver:
+            self.room_manager.archiver.add(self.room_name, msg)
+        payload = self.room_manager.encode_envelope(msg)
+        await self._handle_message(channel, payload)
         if self.redis:
-            event = RedisMessage(user=user, message=message)
-            await self.redis.publish(channel, event.model_dump_json())
+            await self.redis.publish(channel, payload)
 
     async def _pub_user_message(self, user: UserInfo, message: str):
         await self._pub_message(self.chat_channel, user, message)
@@ -1,18 +1,158 @@
-from dataclasses import dataclass
+import asyncio
+import json
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, List, Optional, Set, Union
 
 from pydantic import BaseModel
 from starlette.websockets import WebSocket
 
+from .rate_limit import TokenBucket
+
+# 后台断开任务的引用, 事件循环只持有弱引用, 不保存的话任务可能在完成前被回收
+_background_tasks: Set[asyncio.Task] = set()
+
 @dataclass
 class UserInfo:
     phone_number: str
     username: str
 
+class SlowConsumerPolicy:
+    # 发送队列满时丢弃最旧的一帧
+    DROP_OLDEST = "drop_oldest"
+    # 发送队列满时以 1008 断开这个慢客户端
+    DISCONNECT = "disconnect"
+
+
 @dataclass
 class UserConnection(UserInfo):
+    """
+    一个 WebSocket 连接, 带有界的发送队列和独立的写任务。
+
+    广播只调用 send() 把同一份编码好的帧放进队列, 不等待网络; 写任务按顺序把队列里的帧发出去。
+    队列满时按 policy 处理, 慢客户端不会拖住整个房间。
+
+    binary 为 True 的连接协商了 msgpack 子协议, 队列里是 bytes 帧, 其余连接是 JSON 文本帧。
+
+    bucket 是这个连接发消息的令牌桶, throttled 是因为发送太快被拒绝的次数。
+    """
+
     websocket: WebSocket
+    queue_size: int = 256
+    policy: str = SlowConsumerPolicy.DROP_OLDEST
+    sent: int = 0
+    dropped: int = 0
+    closed: bool = False
+    binary: bool = False
+    bucket: Optional[TokenBucket] = None
+    throttled: int = 0
+    _outbox: Deque[Union[str, bytes]] = field(default_factory=deque, init=False, repr=False)
+    _wakeup: asyncio.Event = field(default_factory=asyncio.Event, init=False, repr=False)
+    _writer: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._outbox)
+
+    def start(self):
+        if not self._writer:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, frame: Union[str, bytes]) -> bool:
+        """非阻塞地把一帧已经编码好的帧放进发送队列, 返回是否入队。"""
+        if self.closed:
+            return False
+        if len(self._outbox) >= self.queue_size:
+            self.dropped += 1
+            if self.policy == SlowConsumerPolicy.DISCONNECT:
+                self.closed = True
+                self._outbox.clear()
+                task = asyncio.create_task(self.disconnect(1008, "slow consumer"))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+                return False
+            self._outbox.popleft()
+        self._outbox.append(frame)
+        self._wakeup.set()
+        return True
+
+    def replay(
+        self,
+        frames: List[Union[str, bytes]],
+        ids: Set[str],
+        packed_id: Optional[Callable[[bytes], Optional[str]]] = None,
+    ):
+        """
+        把补发的历史帧放到队列最前面。
+
+        补发期间已经入队的实时帧如果也在历史里 (ids), 去掉这一份, 客户端不会收到两次;
+        二进制帧的 id 由 packed_id 取出。
+        """
+        live = []
+        for frame in self._outbox:
+            if isinstance(frame, bytes):
+                if packed_id is None or packed_id(frame) not in ids:
+                    live.append(frame)
+                continue
+            obj = json.loads(frame)
+            if isinstance(obj, dict):
+                if obj.get("id") not in ids:
+                    live.append(frame)
+                continue
+            # 合并发送的一批帧
+            kept = [item for item in obj if item.get("id") not in ids]
+            if len(kept) == len(obj):
+                live.append(frame)
+            elif kept:
+                live.append(json.dumps(kept, ensure_ascii=False, separators=(",", ":")))
+        self._outbox = deque(frames + live)
+        if self._outbox:
+            self._wakeup.set()
+
+    async def close(self):
+        self.closed = True
+        self._outbox.clear()
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+        self._writer = None
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._outbox:
+                    frame = self._outbox.popleft()
+                    if isinstance(frame, bytes):
+                        await self.websocket.send_bytes(frame)
+                    else:
+                        await self.websocket.send_text(frame)
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 连接已经断开, 等 on_disconnect 来清理
+            print(f"Writer for {self.phone_number} stopped: {e}")
+            self.closed = True
+            self._outbox.clear()
+
+    async def disconnect(self, code: int, reason: str):
+        """停止发送并由服务端关闭连接, 例如慢客户端或者会话被别的节点接管。"""
+        await self.close()
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception as e:
+            print(f"Close connection {self.phone_number} failed: {e}")
 
 class RedisMessage(BaseModel):
+    # 发布消息的节点, 放在第一个字段, 监听端只看开头就能跳过自己发的消息
+    node: str | None = None
+    # 历史流里的 id, 客户端重连时作为 last_id 传回来
+    id: str | None = None
     user: UserInfo
     message: str | None = None
 
@@ -25,4 +25,14 @@ redis_pool = ConnectionPool.from_url(
 
 redis_client = Redis(connection_pool=redis_pool)
 
-all = ["Base", "AuthToeknHelper", "SessionLocal", "get_settings", "redis_client"]
\ No newline at end of file
+# 不解码的连接, 聊天室的 msgpack 信封是二进制
+redis_wire_pool = ConnectionPool.from_url(
+        get_settings().REDIS_URL,
+        decode_responses=False,
+        socket_connect_timeout=5,
+        socket_timeout=5,
+    )
+
+redis_wire_client = Redis(connection_pool=redis_wire_pool)
+
+all = ["Base", "AuthToeknHelper", "SessionLocal", "get_settings", "redis_client", "redis_wire_client"]
\ No newline at end of file
@@ -1,12 +1,24 @@
 import pathlib
+from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 
 from .app.routers.user import router as user_router
 from .app.routers.room import router_chat
+from .impl import message_archiver, room_manager
 
-app = FastAPI(title="Chat Room Application")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await message_archiver.start()
+    yield
+    # 先停止收发, 再把缓冲里的消息全部归档
+    await room_manager.close()
+    await message_archiver.stop()
+
+
+app = FastAPI(title="Chat Room Application", lifespan=lifespan)
 
 static_dir = pathlib.Path(__file__).parent / "app" / "static"
 templates_dir = pathlib.Path(__file__).parent / "app" / "templates"
@@ -1,10 +1,7 @@
 from pydantic import BaseModel
 from typing import Optional
 
-from passlib.context import CryptContext
-
-# Initialize password context for hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from fastapi_book.infra import password_hasher
 
 
 class User(BaseModel):
@@ -19,5 +16,5 @@ class User(BaseModel):
 class UserInDB(User):
     password: str
 
-    def verify_password(self, password: str) -> bool:
-        return pwd_context.verify(password, self.password)
+    async def verify_password(self, password: str) -> bool:
+        return await password_hasher.verify_password(password, self.password)
@@ -96,7 +96,7 @@ class AuthorizationCodeFlowService(OAuth2Service):
 
     async def authenticate_user(self, username: str, password: str) -> UserInDB:
         user = await self.user_repo.get_user(username)
-        if user.verify_password(password):
+        if await user.verify_password(password):
             return user
         raise UnauthorizedClientException("Invalid username or password")
 
@@ -2,10 +2,16 @@
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from starlette.status import HTTP_401_UNAUTHORIZED
 
-from ..domain.service import UserService, ShortService
-from ..infra import SessionLocal
+from ..domain.service import UserService, ShortService, StatsService
+from ..domain.tag_filter import short_tag_filter
+from ..infra import SessionLocal, short_url_cache
+from ..infra.utils import verified_token_cache
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/oauth2/authorize")
 
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
     async with SessionLocal() as session:
@@ -18,4 +24,17 @@ async def get_user_service(db: AsyncSession = Depends(get_db_session)):
     yield UserService(db)
 
 async def get_short_service(db: AsyncSession = Depends(get_db_session)):
-    yield ShortService(db)
\ No newline at end of file
+    yield ShortService(db, short_url_cache, short_tag_filter)
+
+async def get_stats_service(db: AsyncSession = Depends(get_db_session)):
+    yield StatsService(db)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    payload = verified_token_cache.decode(token)
+    if not payload:
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
\ No newline at end of file
@@ -1,5 +1,15 @@
 
-from pydantic import BaseModel
+from datetime import datetime, timezone
+
+from pydantic import BaseModel, field_validator
+
+
+def _to_naive_utc(value: datetime | None) -> datetime | None:
+    # 数据库里存 naive UTC, 不带时区的输入按 UTC 处理
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 
 class SingleShortUrlCreateDTO(BaseModel):
     
@@ -10,4 +20,16 @@ class SingleShortUrlCreateDTO(BaseModel):
     short_tag: str = ""
     created_by: str = ""
 
-    msg_content: str = ""
\ No newline at end of file
+    msg_content: str = ""
+    expires_at: datetime | None = None
+
+    _normalize_expires_at = field_validator("expires_at")(_to_naive_utc)
+
+
+class BulkShortUrlItemDTO(BaseModel):
+
+    long_url: str
+    msg_content: str | None = None
+    expires_at: datetime | None = None
+
+    _normalize_expires_at = field_validator("expires_at")(_to_naive_utc)
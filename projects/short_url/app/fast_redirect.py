@@ -0,0 +1,101 @@
+from dataclasses import asdict
+from urllib.parse import quote
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..domain.models import is_expired
+from ..domain.service import ShortService
+from ..domain.tag_filter import short_tag_filter
+from ..domain.visit_counter import visit_counter
+from ..domain.analytics import click_recorder
+from ..infra import SessionLocal, short_url_cache
+from ..infra.utils import BASE62_ALPHABET
+
+
+_TAG_CHARS = frozenset(BASE62_ALPHABET)
+
+_NOT_FOUND_BODY = b"Short URL not found"
+_NOT_FOUND_START = {
+    "type": "http.response.start",
+    "status": 404,
+    "headers": [
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"content-length", str(len(_NOT_FOUND_BODY)).encode()),
+    ],
+}
+_NOT_FOUND_BODY_MESSAGE = {"type": "http.response.body", "body": _NOT_FOUND_BODY}
+_EMPTY_BODY_MESSAGE = {"type": "http.response.body", "body": b""}
+
+
+class FastRedirectMiddleware:
+    """
+    GET /{short_tag} 的 ASGI 快速通道, 绕过 FastAPI 的路由和依赖解析。
+
+    Bloom filter 拒绝的 tag 直接返回 404; 缓存命中时直接写出 302;
+    只有缓存未命中才打开数据库会话查询。其余请求原样交给下游应用。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._reserved: frozenset[str] | None = None
+
+    def _reserved_paths(self, scope: Scope) -> frozenset[str]:
+        # /docs、/redoc 这类固定路由也符合 tag 的字符集, 不能被拦截
+        if self._reserved is None:
+            app = scope.get("app") or self.app
+            paths = (getattr(route, "path", "") for route in getattr(app, "routes", []))
+            self._reserved = frozenset(path for path in paths if path and "{" not in path)
+        return self._reserved
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        path: str = scope["path"]
+        short_tag = path[1:]
+        if (
+            not short_tag
+            or not _TAG_CHARS.issuperset(short_tag)
+            or path in self._reserved_paths(scope)
+        ):
+            return await self.app(scope, receive, send)
+
+        if not short_tag_filter.might_contain(short_tag):
+            await send(_NOT_FOUND_START)
+            await send(_NOT_FOUND_BODY_MESSAGE)
+            return
+
+        data = await short_url_cache.get(short_tag)
+        if data is None:
+            async with SessionLocal() as db:
+                record = await ShortService(db).get_short_url(short_tag)
+            if record is None:
+                await send(_NOT_FOUND_START)
+                await send(_NOT_FOUND_BODY_MESSAGE)
+                return
+            data = asdict(record)
+            await short_url_cache.set(short_tag, data, ttl=record.ttl())
+        elif is_expired(data.get("expires_at")):
+            await send(_NOT_FOUND_START)
+            await send(_NOT_FOUND_BODY_MESSAGE)
+            return
+
+        visit_counter.incr(data["id"])
+        if click_recorder.redis:
+            headers = dict(scope["headers"])
+            click_recorder.record(
+                data["id"],
+                referrer=headers.get(b"referer", b"").decode("latin-1"),
+                user_agent=headers.get(b"user-agent", b"").decode("latin-1"),
+                country=headers.get(b"x-country-code", b"").decode("latin-1"),
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 302,
+                "headers": [
+                    (b"location", quote(data["long_url"], safe=":/%#?=@[]!$&'()*+,;").encode("latin-1")),
+                    (b"content-length", b"0"),
+                ],
+            }
+        )
+        await send(_EMPTY_BODY_MESSAGE)
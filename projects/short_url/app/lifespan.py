@@ -1,30 +1,118 @@
 
 from contextlib import asynccontextmanager
+from dataclasses import asdict
+from pathlib import Path
+
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from fastapi import FastAPI
+from sqlalchemy import text
 
-from ..infra import async_engine, Base, SessionLocal
+from ..infra import async_engine, Base, SessionLocal, short_url_cache, get_settings
 from ..infra.utils import PasslibHelper
-from ..domain.service import UserService
+from ..domain.service import UserService, ShortService
+from ..domain.visit_counter import visit_counter
+from ..domain.tag_filter import short_tag_filter
+from ..domain.analytics import click_recorder, click_rollup_worker
+from ..domain.expiry_sweeper import expiry_sweeper
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("🚀 App startup")
+# pg_advisory_xact_lock 的 key, 保证多个 worker 同时启动时只有一个在建表/写初始数据
+STARTUP_LOCK_KEY = 0x5348_4F52_5455_524C
+
+ALEMBIC_INI = Path(__file__).resolve().parents[3] / "alembic.ini"
+
+
+def _current_revisions(conn) -> set[str]:
+    return set(MigrationContext.configure(conn).get_current_heads())
+
+
+def _alembic_heads() -> set[str]:
+    if not ALEMBIC_INI.exists():
+        return set()
+    return set(ScriptDirectory.from_config(Config(str(ALEMBIC_INI))).get_heads())
+
 
-    async def init_create_table():
-        async with async_engine.begin() as conn:
-            await conn.run_sync(Base.metadata.drop_all)
+async def init_schema_and_seed():
+    """
+    幂等的启动初始化。
+
+    数据库已经有 alembic 版本号时, 表结构由迁移管理, 这里不做任何 DDL, 版本号不是最新时提示先升级;
+    否则只创建缺失的表。管理员账号不存在时才创建。整个过程在一个事务里,
+    PostgreSQL 下用事务级 advisory lock 串行化; SQLite 下 pysqlite 不会为 DDL 和 SELECT
+    开事务, 所以先显式 BEGIN IMMEDIATE 拿到写锁, 其它 worker 在这里等待。
+    """
+    async with async_engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+        elif conn.dialect.name == "sqlite":
+            await conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+        revisions = await conn.run_sync(_current_revisions)
+        if revisions:
+            heads = _alembic_heads()
+            if heads and revisions != heads:
+                print(
+                    f"⚠️ Schema revision {', '.join(sorted(revisions))} is not alembic head "
+                    f"{', '.join(sorted(heads))}, run `alembic upgrade head`"
+                )
+            else:
+                print(f"Schema managed by alembic, revision {', '.join(sorted(revisions))}")
+        else:
             await conn.run_sync(Base.metadata.create_all)
 
-    async def create_admin_user():
-        async with SessionLocal() as db:
-            await UserService(db).create_user(
-                username="admin",
-                password=PasslibHelper.hash_password("123456")
-            )
+        async with SessionLocal(bind=conn) as db:
+            user_service = UserService(db)
+            if not await user_service.get_user_by_name("admin"):
+                await user_service.create_user(
+                    username="admin",
+                    password=await PasslibHelper.hash_password("123456")
+                )
+
+
+async def preload_redirect_cache(top_n: int):
+    """把访问量最高的 top_n 个短链预先放进本进程的重定向缓存。"""
+    if top_n <= 0:
+        return
+    async with SessionLocal() as db:
+        records = await ShortService(db).get_top_short_urls(top_n)
+    for record in records:
+        ttl = record.ttl()
+        short_url_cache.local.set(
+            record.short_tag,
+            asdict(record),
+            ttl=None if ttl is None else min(ttl, short_url_cache.local.ttl),
+        )
+    print(f"Preloaded {len(records)} short URLs into redirect cache.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("🚀 App startup")
 
-    await init_create_table()
-    await create_admin_user()
+    await init_schema_and_seed()
+    await short_url_cache.start()
+    await visit_counter.start()
+    if get_settings().BLOOM_FILTER_ENABLED:
+        if short_tag_filter.redis:
+            await short_tag_filter.start()
+        else:
+            # 没有 Redis 时别的 worker 新建的 tag 要等到下次重建才知道, 期间会被误判为 404
+            print("Bloom filter disabled: REDIS_URL is not configured.")
+    await click_recorder.start()
+    if click_rollup_worker:
+        await click_rollup_worker.start()
+    if get_settings().EXPIRY_SWEEP_ENABLED:
+        await expiry_sweeper.start()
+    await preload_redirect_cache(get_settings().CACHE_PRELOAD_TOP_N)
 
     yield
+    await expiry_sweeper.stop()
+    if click_rollup_worker:
+        await click_rollup_worker.stop()
+    await click_recorder.stop()
+    await short_tag_filter.stop()
+    await visit_counter.stop()
+    await short_url_cache.stop()
     print("👋 App shutdown")
@@ -1,24 +1,30 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Request
 
 from fastapi.responses import RedirectResponse, PlainTextResponse
-from ..depends import get_short_service, ShortService
+from ...infra import SessionLocal, short_url_cache
+from ...domain.service import ShortService
+from ...domain.tag_filter import short_tag_filter
+from ...domain.visit_counter import visit_counter
+from ...domain.analytics import click_recorder
 
 router_short = APIRouter(tags=["short_url"])
 
 @router_short.get("/{short_tag}")
-async def short_redirect(
-    *,
-    short_tag: str,
-    short_service: ShortService = Depends(get_short_service),
-    tasks: BackgroundTasks,
-):
+async def short_redirect(short_tag: str, request: Request):
+    # Bloom filter 判定不存在的 tag 直接返回, 不打开数据库会话
+    if not short_tag_filter.might_contain(short_tag):
+        return PlainTextResponse("Short URL not found", status_code=404)
 
-    data = await short_service.get_short_url(short_tag)
+    async with SessionLocal() as db:
+        data = await ShortService(db, short_url_cache).get_short_url(short_tag)
     if not data:
         return PlainTextResponse("Short URL not found", status_code=404)
 
-    data.visits_count += 1
-    tasks.add_task(
-        short_service.update_short_url, data.id, visits_count=data.visits_count
+    visit_counter.incr(data.id)
+    click_recorder.record(
+        data.id,
+        referrer=request.headers.get("referer", ""),
+        user_agent=request.headers.get("user-agent", ""),
+        country=request.headers.get("x-country-code", ""),
     )
-    return RedirectResponse(data.long_url)
+    return RedirectResponse(data.long_url, status_code=302)
@@ -1,18 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import io
+import json
+from typing import Literal
 
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from fastapi.security import OAuth2PasswordRequestForm
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND, HTTP_409_CONFLICT
 
 from datetime import datetime, timedelta, timezone
 
-from ..dto import SingleShortUrlCreateDTO
-from ..depends import get_user_service, get_short_service, UserService, ShortService
-from ...infra.utils import AuthTokenHelper, PasslibHelper, generate_short_url
+from ..dto import SingleShortUrlCreateDTO, BulkShortUrlItemDTO
+from ..streaming import iter_json_items, BodyStreamingResponse
+from ..depends import get_user_service, get_short_service, get_stats_service, get_current_user, UserService, ShortService, StatsService
+from ...infra import SessionLocal, get_settings, short_url_cache
+from ...infra.utils import AuthTokenHelper, PasslibHelper
+from fastapi_book.infra import password_hasher
+from ...domain.id_allocator import short_tag_allocator
+from ...domain.tag_filter import short_tag_filter
 
 router_user = APIRouter(prefix="/api/v1", tags=["manage"])
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/oauth2/authorize")
-
 
 @router_user.post("/oauth2/authorize", summary="OAuth2 - Authorization")
 async def login(
@@ -28,7 +39,7 @@ async def login(
     if not user_info:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="User not found")
 
-    if not PasslibHelper.verify_password(user_data.password, user_info.password):
+    if not await PasslibHelper.verify_password(user_data.password, user_info.password):
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED, detail="Incorrect password"
         )
@@ -49,19 +60,178 @@ async def login(
 @router_user.post("/create/single/short", summary="Create single short URL")
 async def create_single_short_url(
     create_dto: SingleShortUrlCreateDTO,
-    token: str = Depends(oauth2_scheme),
+    payload: dict = Depends(get_current_user),
     short_service: ShortService = Depends(get_short_service),
 ):
-    payload = AuthTokenHelper.token_decode(token)
-    if not payload:
-        raise HTTPException(
-            status_code=HTTP_401_UNAUTHORIZED, detail="Invalid authentication token"
-        )
-    
-    create_dto.short_tag = generate_short_url()
-    create_dto.short_url = f"{create_dto.short_url}{create_dto.short_tag}"
+    base_url = create_dto.short_url
     create_dto.created_by = payload.get("username")
-    create_dto.msg_content = f"hello, click {create_dto.short_url}"
-    print(create_dto)
-    result = await short_service.create_short_url(**create_dto.model_dump())
+    # 新分配的 tag 不会互相冲突, 只可能撞上旧的随机 tag, 换下一个 ID 重试即可
+    for _ in range(3):
+        create_dto.short_tag = await short_tag_allocator.next_tag()
+        create_dto.short_url = f"{base_url}{create_dto.short_tag}"
+        create_dto.msg_content = f"hello, click {create_dto.short_url}"
+        try:
+            result = await short_service.create_short_url(**create_dto.model_dump())
+            break
+        except IntegrityError:
+            continue
+    else:
+        raise HTTPException(status_code=HTTP_409_CONFLICT, detail="Short tag collision")
     return {"code": 200, "msg": "Short URL created successfully", "data": result}
+
+
+@router_user.post("/create/bulk/short", summary="Bulk create short URLs (NDJSON or JSON array)")
+async def create_bulk_short_urls(
+    request: Request,
+    base_url: str = "http://127.0.0.1:8000/",
+    payload: dict = Depends(get_current_user),
+):
+    created_by = payload.get("username")
+    chunk_size = get_settings().BULK_INSERT_CHUNK_SIZE
+
+    async def insert_chunk(short_service: ShortService, chunk: list[BulkShortUrlItemDTO]) -> str:
+        for _ in range(3):
+            tags = await short_tag_allocator.next_tags(len(chunk))
+            rows = []
+            for item, short_tag in zip(chunk, tags):
+                short_url = f"{base_url}{short_tag}"
+                rows.append({
+                    "short_tag": short_tag,
+                    "short_url": short_url,
+                    "long_url": item.long_url,
+                    "visits_count": 0,
+                    "created_by": created_by,
+                    "msg_content": item.msg_content or f"hello, click {short_url}",
+                    "expires_at": item.expires_at,
+                })
+            try:
+                result = await short_service.create_batch_short_urls(rows)
+                break
+            except IntegrityError:
+                # 撞上旧的随机 tag, 整批换一组新 ID 重试
+                continue
+        else:
+            return json.dumps({"error": "Short tag collision", "count": len(chunk)}) + "\n"
+        return "".join(
+            json.dumps({"id": row.id, "short_tag": row.short_tag, "short_url": f"{base_url}{row.short_tag}"}) + "\n"
+            for row in result
+        )
+
+    async def results():
+        async with SessionLocal() as db:
+            short_service = ShortService(db, short_url_cache, short_tag_filter)
+            chunk: list[BulkShortUrlItemDTO] = []
+            index = 0
+            malformed = None
+            try:
+                async for item in iter_json_items(request.stream()):
+                    try:
+                        chunk.append(BulkShortUrlItemDTO.model_validate(item))
+                    except ValidationError as e:
+                        yield json.dumps({"error": e.errors(include_url=False, include_context=False), "index": index}) + "\n"
+                    index += 1
+                    if len(chunk) >= chunk_size:
+                        yield await insert_chunk(short_service, chunk)
+                        chunk = []
+            except ValueError as e:
+                malformed = json.dumps({"error": str(e), "index": index}) + "\n"
+            # 请求体后面格式错误时, 前面已经解析出的元素照常写入, 结果按输入顺序排在错误之前
+            if chunk:
+                yield await insert_chunk(short_service, chunk)
+            if malformed:
+                yield malformed
+
+    return BodyStreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router_user.get("/links", summary="List own short URLs (keyset pagination)")
+async def list_short_urls(
+    after: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    payload: dict = Depends(get_current_user),
+    short_service: ShortService = Depends(get_short_service),
+):
+    rows = await short_service.list_short_urls(
+        payload.get("username"), after_id=after, limit=limit
+    )
+    next_cursor = rows[-1].id if len(rows) == limit else None
+    return {"code": 200, "data": rows, "next_cursor": next_cursor}
+
+
+EXPORT_COLUMNS = ["id", "short_tag", "short_url", "long_url", "visits_count", "created_at", "expires_at"]
+
+
+@router_user.get("/links/export", summary="Export own short URLs as CSV or NDJSON")
+async def export_short_urls(
+    format: Literal["csv", "ndjson"] = "csv",
+    payload: dict = Depends(get_current_user),
+):
+    created_by = payload.get("username")
+
+    async def rows_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        async with SessionLocal() as db:
+            async for rows in ShortService(db).stream_short_urls(created_by):
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    async def rows_ndjson():
+        async with SessionLocal() as db:
+            async for rows in ShortService(db).stream_short_urls(created_by):
+                yield "".join(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + "\n"
+                    for row in rows
+                )
+
+    if format == "csv":
+        return StreamingResponse(
+            rows_csv(),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="short_urls.csv"'},
+        )
+    return StreamingResponse(rows_ndjson(), media_type="application/x-ndjson")
+
+
+@router_user.get("/links/{short_tag}/stats", summary="Hourly click rollups of a short URL")
+async def short_url_stats(
+    short_tag: str,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    payload: dict = Depends(get_current_user),
+    stats_service: StatsService = Depends(get_stats_service),
+):
+    rows = await stats_service.get_hourly_stats(
+        short_tag, created_by=payload.get("username"), start=start, end=end
+    )
+    if rows is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Short URL not found")
+    data = [
+        {
+            "hour": row.hour,
+            "referrer": row.referrer,
+            "ua_family": row.ua_family,
+            "country": row.country,
+            "clicks": row.clicks,
+        }
+        for row in rows
+    ]
+    return {"code": 200, "data": data, "total": sum(row.clicks for row in rows)}
+
+
+@router_user.get("/stats/cache", summary="Redirect cache hit/miss counters")
+async def cache_stats(payload: dict = Depends(get_current_user)):
+    data = short_url_cache.stats.as_dict()
+    data["local_size"] = len(short_url_cache.local)
+    data["local_maxsize"] = short_url_cache.local.maxsize
+    data["bloom_rejected"] = short_tag_filter.rejected
+    return {"code": 200, "data": data}
+
+
+@router_user.get("/stats/password_hasher", summary="Password hashing pool usage and queue depth")
+async def password_hasher_stats(payload: dict = Depends(get_current_user)):
+    return {"code": 200, "data": password_hasher.stats()}
@@ -0,0 +1,67 @@
+import codecs
+import json
+from typing import Any, AsyncIterator
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+_WHITESPACE = " \t\r\n"
+
+
+async def iter_json_items(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """
+    边接收请求体边解析, 支持 NDJSON 和顶层 JSON 数组两种格式。
+
+    每解析出一个完整的元素就 yield 出来, 内存里只保留尚未解析完的那一小段。
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    is_array: bool | None = None
+    closed = False
+
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and (
+                buffer[pos] in _WHITESPACE or (is_array and buffer[pos] == ",")
+            ):
+                pos += 1
+            if pos >= len(buffer) or closed:
+                break
+            if is_array is None:
+                is_array = buffer[pos] == "["
+                if is_array:
+                    pos += 1
+                continue
+            if is_array and buffer[pos] == "]":
+                closed = True
+                pos += 1
+                continue
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 元素还不完整, 等待更多数据
+                break
+            yield item
+        buffer = buffer[pos:]
+
+    buffer += utf8.decode(b"", final=True)
+    if buffer.strip() or (is_array and not closed):
+        raise ValueError("Malformed JSON body")
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    响应内容依赖请求体时使用的 StreamingResponse。
+
+    StreamingResponse 在旧版 ASGI 下会并发调用 receive() 监听断开, 会和 request.stream()
+    抢请求体; 这里只负责发送, 客户端断开时 request.stream() 会抛出 ClientDisconnect。
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,91 @@
+"""
+对比 GET /{short_tag} 走 ASGI 快速通道和走 FastAPI 路由的吞吐 (requests/sec)。
+
+    uv run python -m projects.short_url.benchmarks.redirect_fast_path --links 1000 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+# 必须在导入应用之前设置, 使用临时的 sqlite 库, 并且不自动挂载快速通道
+_tmp_dir = tempfile.mkdtemp(prefix="short_url_bench_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{_tmp_dir}/bench.db")
+os.environ["FAST_REDIRECT_ENABLED"] = "false"
+
+import httpx
+
+from ..main import app
+from ..app.fast_redirect import FastRedirectMiddleware
+from ..domain.id_allocator import short_tag_allocator
+from ..domain.service import ShortService
+from ..domain.tag_filter import short_tag_filter
+from ..infra import SessionLocal
+
+
+async def seed_links(n: int) -> list[str]:
+    tags = await short_tag_allocator.next_tags(n)
+    async with SessionLocal() as db:
+        service = ShortService(db)
+        for i in range(0, n, 1000):
+            await service.create_batch_short_urls(
+                [
+                    {
+                        "short_tag": tag,
+                        "short_url": f"http://127.0.0.1:8000/{tag}",
+                        "long_url": f"https://example.com/{tag}",
+                        "visits_count": 0,
+                        "created_by": "bench",
+                        "msg_content": "bench",
+                    }
+                    for tag in tags[i:i + 1000]
+                ]
+            )
+    await short_tag_filter.rebuild()
+    return tags
+
+
+async def run(asgi_app, tags: list[str], total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = total
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                resp = await client.get(f"/{random.choice(tags)}")
+                assert resp.status_code in (302, 307), resp.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+async def main(args):
+    async with app.router.lifespan_context(app):
+        tags = await seed_links(args.links)
+        targets = {
+            "fastapi_route": app,
+            "asgi_fast_path": FastRedirectMiddleware(app),
+        }
+        # 先各跑一轮预热缓存
+        for target in targets.values():
+            await run(target, tags, min(len(tags) * 2, args.requests), args.concurrency)
+        results = {
+            name: await run(target, tags, args.requests, args.concurrency)
+            for name, target in targets.items()
+        }
+    for name, rps in results.items():
+        print(f"{name:<16} {rps:>10.1f} req/s")
+    print(f"speedup          {results['asgi_fast_path'] / results['fastapi_route']:>10.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
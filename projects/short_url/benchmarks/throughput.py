@@ -0,0 +1,278 @@
+"""
+short_url 热路径的吞吐/延迟基准: 重定向、创建短链、登录三个接口的 requests/sec 和 p50/p95/p99。
+
+默认在进程内通过 httpx.ASGITransport 驱动应用; --server uvicorn 时启动一个真实的 uvicorn
+子进程走 localhost。数据库是 sqlite, 预先写入 --links 条合成短链 (默认 100 万),
+--db 指定已有的库时会复用, 只补齐缺少的行。--json 把结果写成文件, 方便不同版本之间对比。
+
+    uv run python -m projects.short_url.benchmarks.throughput --links 1000000 --json bench.json
+    uv run python -m projects.short_url.benchmarks.throughput --server uvicorn --scenarios redirect
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=1_000_000, help="预先写入的短链数量")
+    parser.add_argument("--db", help="sqlite 文件路径, 默认使用临时目录")
+    parser.add_argument("--server", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--scenarios", default="redirect,create,login", help="逗号分隔")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--redirect-requests", type=int, default=20000)
+    parser.add_argument("--create-requests", type=int, default=2000)
+    # bcrypt 很慢, 登录请求数默认少一些
+    parser.add_argument("--login-requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=1000, help="每个场景正式计时前的预热请求数")
+    parser.add_argument("--sample", type=int, default=100000, help="重定向随机访问的 tag 数量")
+    parser.add_argument("--json", dest="json_path", help="把结果写到 JSON 文件")
+    return parser.parse_args()
+
+
+# 配置在导入应用时读取, 必须先设置环境变量
+_args = _parse_args() if __name__ == "__main__" else None
+_db_path = (
+    os.path.abspath(_args.db)
+    if _args and _args.db
+    else os.path.join(tempfile.mkdtemp(prefix="short_url_bench_"), "bench.db")
+)
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{_db_path}")
+# 一次租用足够大的号段, 写入 100 万条时不必反复更新分配表
+os.environ.setdefault("SHORT_ID_BLOCK_SIZE", "100000")
+
+import httpx
+from sqlalchemy import select, insert, func
+
+from ..main import app
+from ..app.lifespan import init_schema_and_seed
+from ..domain.id_allocator import short_tag_allocator
+from ..domain.models import ShortUrl
+from ..infra import SessionLocal
+
+
+BENCH_USER = "bench"
+SEED_CHUNK_SIZE = 10000
+
+
+async def seed_links(n: int):
+    """补齐到 n 条 created_by=bench 的短链。"""
+    async with SessionLocal() as db:
+        existing = await db.scalar(
+            select(func.count()).select_from(ShortUrl).where(ShortUrl.created_by == BENCH_USER)
+        )
+    missing = n - existing
+    if missing <= 0:
+        print(f"Reusing {existing} seeded links.")
+        return
+    start = time.perf_counter()
+    tags = await short_tag_allocator.next_tags(missing)
+    table = ShortUrl.__table__
+    for i in range(0, missing, SEED_CHUNK_SIZE):
+        async with SessionLocal() as db:
+            await db.execute(
+                insert(table),
+                [
+                    {
+                        "short_tag": tag,
+                        "short_url": f"http://127.0.0.1:8000/{tag}",
+                        "long_url": f"https://example.com/{tag}",
+                        "visits_count": 0,
+                        "created_by": BENCH_USER,
+                        "msg_content": "bench",
+                    }
+                    for tag in tags[i:i + SEED_CHUNK_SIZE]
+                ],
+            )
+            await db.commit()
+    print(f"Seeded {missing} links in {time.perf_counter() - start:.1f}s.")
+
+
+async def sample_tags(k: int) -> list[str]:
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(ShortUrl.short_tag)
+            .where(ShortUrl.created_by == BENCH_USER)
+            .order_by(func.random())
+            .limit(k)
+        )
+        return list(result.scalars())
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """nearest-rank 百分位。"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request, total: int, concurrency: int) -> dict:
+    """make_request(client) 返回响应是否符合预期。"""
+    latencies: list[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            begin = time.perf_counter()
+            try:
+                ok = await make_request(client)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - begin)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def build_scenarios(tags: list[str], token: str) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def redirect(client: httpx.AsyncClient) -> bool:
+        resp = await client.get(f"/{random.choice(tags)}")
+        return resp.status_code == 302
+
+    async def create(client: httpx.AsyncClient) -> bool:
+        resp = await client.post(
+            "/api/v1/create/single/short",
+            json={"long_url": f"https://example.com/new/{random.getrandbits(64):x}"},
+            headers=headers,
+        )
+        return resp.status_code == 200
+
+    async def login(client: httpx.AsyncClient) -> bool:
+        resp = await client.post(
+            "/api/v1/oauth2/authorize", data={"username": "admin", "password": "123456"}
+        )
+        return resp.status_code == 200
+
+    return {"redirect": redirect, "create": create, "login": login}
+
+
+async def run_all(client: httpx.AsyncClient, args: argparse.Namespace, tags: list[str]) -> dict:
+    resp = await client.post(
+        "/api/v1/oauth2/authorize", data={"username": "admin", "password": "123456"}
+    )
+    resp.raise_for_status()
+    scenarios = build_scenarios(tags, resp.json()["access_token"])
+    totals = {
+        "redirect": args.redirect_requests,
+        "create": args.create_requests,
+        "login": args.login_requests,
+    }
+    results = {}
+    for name in args.scenarios.split(","):
+        name = name.strip()
+        total = totals[name]
+        await run_scenario(client, scenarios[name], min(args.warmup, total), args.concurrency)
+        results[name] = await run_scenario(client, scenarios[name], total, args.concurrency)
+        print(f"{name:<10} {json.dumps(results[name])}")
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            try:
+                if (await client.get("/docs")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+async def bench_asgi(args: argparse.Namespace, tags: list[str]) -> dict:
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_all(client, args, tags)
+
+
+async def bench_uvicorn(args: argparse.Namespace, tags: list[str]) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "projects.short_url.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log",
+        ],
+        env=os.environ.copy(),
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        await _wait_ready(base_url, proc)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+            return await run_all(client, args, tags)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+async def main(args: argparse.Namespace):
+    await init_schema_and_seed()
+    await seed_links(args.links)
+    tags = await sample_tags(args.sample)
+    if args.server == "uvicorn":
+        # 子进程要用同一个库, 先释放本进程持有的连接
+        from ..infra import async_engine
+        await async_engine.dispose()
+        results = await bench_uvicorn(args, tags)
+    else:
+        results = await bench_asgi(args, tags)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "server": args.server,
+        "database": os.environ["ASYNC_DATABASE_URL"],
+        "links": args.links,
+        "concurrency": args.concurrency,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(_args))
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import socket
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .service import StatsService
+from ..infra import SessionLocal, redis_client, get_settings
+
+
+CLICK_STREAM = "short_url:clicks"
+CLICK_GROUP = "short_url:rollup"
+
+
+def ua_family(user_agent: str) -> str:
+    """把 User-Agent 粗略归类, 控制汇总表的基数。"""
+    ua = user_agent.lower()
+    if not ua:
+        return ""
+    if "bot" in ua or "spider" in ua or "crawl" in ua:
+        return "bot"
+    if "micromessenger" in ua:
+        return "wechat"
+    if "edg/" in ua:
+        return "edge"
+    if "chrome/" in ua or "crios/" in ua:
+        return "chrome"
+    if "firefox/" in ua or "fxios/" in ua:
+        return "firefox"
+    if "safari/" in ua:
+        return "safari"
+    if "curl/" in ua or "wget/" in ua or "python" in ua or "httpx" in ua:
+        return "cli"
+    return "other"
+
+
+def referrer_host(referrer: str) -> str:
+    if not referrer:
+        return ""
+    return (urlsplit(referrer).hostname or "")[:255]
+
+
+class ClickRecorder:
+    """
+    重定向时记录点击事件。
+
+    事件先放进内存队列, 后台任务定期用 pipeline 批量 XADD 到 Redis Stream,
+    重定向本身不等待 Redis。分析数据尽力而为: 队列满了丢最旧的, 写 Redis 失败丢掉这一批。
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None,
+        stream: str = CLICK_STREAM,
+        maxlen: int = 1000000,
+        flush_interval: float = 0.5,
+        buffer_size: int = 100000,
+    ):
+        self.redis = redis
+        self.stream = stream
+        self.maxlen = maxlen
+        self.flush_interval = flush_interval
+        self._buffer: deque[dict] = deque(maxlen=buffer_size)
+        self._flush_task: asyncio.Task | None = None
+
+    def record(self, short_url_id: int, referrer: str, user_agent: str, country: str = ""):
+        if not self.redis:
+            return
+        # 字段名尽量短, 减少 stream 占用的内存
+        self._buffer.append(
+            {
+                "i": short_url_id,
+                "t": int(time.time()),
+                "r": referrer_host(referrer),
+                "u": ua_family(user_agent),
+                # 国家暂时只是占位, 由前置代理通过请求头传入
+                "c": country[:2].upper(),
+            }
+        )
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        events = list(self._buffer)
+        self._buffer.clear()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for event in events:
+                    pipe.xadd(self.stream, event, maxlen=self.maxlen, approximate=True)
+                await pipe.execute()
+        except RedisError as e:
+            print(f"Click events dropped ({len(events)}): {e}")
+
+    async def start(self):
+        if self.redis and not self._flush_task:
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+
+
+class ClickRollupWorker:
+    """
+    点击事件流的消费者, 每个进程是消费者组里的一个消费者。
+
+    批量 XREADGROUP 读取事件, 按 (短链, 小时, 来源, UA, 国家) 聚合后一次 upsert 进
+    short_url_stats, 提交成功后再 XACK。语义是至少一次: 提交后、XACK 前崩溃会重复计数。
+    其他消费者挂掉留下的 pending 事件通过 XAUTOCLAIM 接管。
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        session_factory: async_sessionmaker[AsyncSession],
+        stream: str = CLICK_STREAM,
+        group: str = CLICK_GROUP,
+        batch_size: int = 500,
+        block_ms: int = 2000,
+        claim_idle_ms: int = 60000,
+    ):
+        self.redis = redis
+        self.session_factory = session_factory
+        self.stream = stream
+        self.group = group
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self._task: asyncio.Task | None = None
+
+    async def _ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _read_batch(self) -> list[tuple[str, dict]]:
+        # 先接管长时间没有 ACK 的事件, 再读新事件
+        claimed = await self.redis.xautoclaim(
+            self.stream, self.group, self.consumer,
+            min_idle_time=self.claim_idle_ms, count=self.batch_size,
+        )
+        if claimed[1]:
+            return claimed[1]
+        result = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"},
+            count=self.batch_size, block=self.block_ms,
+        )
+        return result[0][1] if result else []
+
+    async def process(self, entries: list[tuple[str, dict]]):
+        counts: Counter[tuple] = Counter()
+        for _, fields in entries:
+            if not fields:
+                # 已经被 MAXLEN 裁掉的事件
+                continue
+            hour = datetime.fromtimestamp(int(fields["t"]), timezone.utc).replace(
+                minute=0, second=0, microsecond=0, tzinfo=None
+            )
+            counts[(int(fields["i"]), hour, fields["r"], fields["u"], fields["c"])] += 1
+        rows = [
+            {
+                "short_url_id": short_url_id,
+                "hour": hour,
+                "referrer": referrer,
+                "ua_family": family,
+                "country": country,
+                "clicks": clicks,
+            }
+            for (short_url_id, hour, referrer, family, country), clicks in counts.items()
+        ]
+        async with self.session_factory() as db:
+            await StatsService(db).upsert_hourly_stats(rows)
+        await self.redis.xack(self.stream, self.group, *[entry_id for entry_id, _ in entries])
+
+    async def start(self):
+        if not self._task:
+            await self._ensure_group()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                entries = await self._read_batch()
+                if entries:
+                    await asyncio.shield(self.process(entries))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 没有 ACK 的事件留在 pending 里, 之后会被重新认领
+                print(f"Click rollup failed: {e}")
+                await asyncio.sleep(1)
+
+
+click_recorder = ClickRecorder(
+    redis_client,
+    maxlen=get_settings().ANALYTICS_STREAM_MAXLEN,
+    flush_interval=get_settings().ANALYTICS_FLUSH_INTERVAL,
+)
+
+click_rollup_worker = (
+    ClickRollupWorker(
+        redis_client, SessionLocal, batch_size=get_settings().ANALYTICS_BATCH_SIZE
+    )
+    if redis_client
+    else None
+)
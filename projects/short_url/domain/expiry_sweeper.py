@@ -0,0 +1,83 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .service import ShortService
+from ..infra import SessionLocal, short_url_cache, get_settings
+from ..infra.cache import TwoTierCache
+
+
+class ExpiredLinkSweeper:
+    """
+    后台清理已过期的短链。
+
+    每轮按批删除, 每批一个短事务, 批与批之间停顿 batch_pause 秒, 避免一次大 DELETE
+    长时间占着写锁拖慢在线请求。过期但还没被清理的短链在重定向时已经视为不存在,
+    所以清理晚一点只影响存储, 不影响正确性。
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        cache: TwoTierCache | None = None,
+        interval: float = 60.0,
+        batch_size: int = 500,
+        batch_pause: float = 0.1,
+    ):
+        self.session_factory = session_factory
+        self.cache = cache
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.deleted = 0
+        self._task: asyncio.Task | None = None
+
+    async def sweep_batch(self) -> int:
+        async with self.session_factory() as db:
+            short_tags = await ShortService(db, self.cache).delete_expired_short_urls(self.batch_size)
+        self.deleted += len(short_tags)
+        return len(short_tags)
+
+    async def sweep(self) -> int:
+        """删到没有过期行为止, 返回本轮删除的行数。"""
+        total = 0
+        while True:
+            n = await asyncio.shield(self.sweep_batch())
+            total += n
+            if n < self.batch_size:
+                return total
+            await asyncio.sleep(self.batch_pause)
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                total = await self.sweep()
+                if total:
+                    print(f"Swept {total} expired short URLs")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Expired short URL sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+expiry_sweeper = ExpiredLinkSweeper(
+    SessionLocal,
+    short_url_cache,
+    interval=get_settings().EXPIRY_SWEEP_INTERVAL,
+    batch_size=get_settings().EXPIRY_SWEEP_BATCH_SIZE,
+    batch_pause=get_settings().EXPIRY_SWEEP_BATCH_PAUSE,
+)
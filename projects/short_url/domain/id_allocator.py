@@ -0,0 +1,128 @@
+import asyncio
+
+from redis.asyncio import Redis
+from sqlalchemy import update, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .models import IdAllocator
+from ..infra import SessionLocal, redis_client, get_settings
+from ..infra.utils import base62_encode, FeistelPermutation
+
+
+class DatabaseBlockSource:
+    """从 short_url_id_allocator 表租用号段。"""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], name: str):
+        self.session_factory = session_factory
+        self.name = name
+
+    async def lease(self, size: int) -> int:
+        """返回号段的起始 ID, 本次租到的是 [start, start + size)。"""
+        async with self.session_factory() as db:
+            while True:
+                result = await db.execute(
+                    update(IdAllocator)
+                    .where(IdAllocator.name == self.name)
+                    .values(next_id=IdAllocator.next_id + size)
+                    .returning(IdAllocator.next_id)
+                )
+                next_id = result.scalar()
+                if next_id is not None:
+                    await db.commit()
+                    return next_id - size
+                try:
+                    # 第一次使用, 初始化这一行; 并发初始化时主键冲突, 重试 UPDATE 即可
+                    await db.execute(
+                        insert(IdAllocator).values(name=self.name, next_id=size + 1)
+                    )
+                    await db.commit()
+                    return 1
+                except IntegrityError:
+                    await db.rollback()
+
+
+class RedisBlockSource:
+    """用 Redis INCRBY 租用号段。"""
+
+    def __init__(self, redis: Redis, name: str):
+        self.redis = redis
+        self.key = f"short_url:id_alloc:{name}"
+
+    async def lease(self, size: int) -> int:
+        end = await self.redis.incrby(self.key, size)
+        return end - size + 1
+
+
+class ShortTagAllocator:
+    """
+    无冲突的 short_tag 生成器。
+
+    ID 单调递增, 每个 worker 一次租用一整段, 段内分配不需要访问数据库或 Redis。
+    ID 经过可选的 Feistel 置换后编码为 base62。注意同一个库只能固定使用一种号段来源,
+    否则不同来源会发出重复的 ID (唯一索引会拒绝, 但会浪费重试)。
+    """
+
+    def __init__(
+        self,
+        source: DatabaseBlockSource | RedisBlockSource,
+        block_size: int = 1000,
+        min_length: int = 6,
+        permutation: FeistelPermutation | None = None,
+    ):
+        self.source = source
+        self.block_size = block_size
+        self.min_length = min_length
+        self.permutation = permutation
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def next_ids(self, n: int) -> list[int]:
+        ids: list[int] = []
+        async with self._lock:
+            while len(ids) < n:
+                if self._next >= self._end:
+                    size = max(self.block_size, n - len(ids))
+                    self._next = await self.source.lease(size)
+                    self._end = self._next + size
+                take = min(n - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+        return ids
+
+    async def next_id(self) -> int:
+        return (await self.next_ids(1))[0]
+
+    def encode(self, num: int) -> str:
+        if self.permutation:
+            num = self.permutation.encrypt(num)
+        return base62_encode(num, self.min_length)
+
+    async def next_tags(self, n: int) -> list[str]:
+        return [self.encode(num) for num in await self.next_ids(n)]
+
+    async def next_tag(self) -> str:
+        return self.encode(await self.next_id())
+
+
+def _create_allocator() -> ShortTagAllocator:
+    settings = get_settings()
+    if settings.SHORT_ID_SOURCE == "redis":
+        if not redis_client:
+            raise RuntimeError("SHORT_ID_SOURCE=redis requires REDIS_URL")
+        source = RedisBlockSource(redis_client, "short_url")
+    else:
+        source = DatabaseBlockSource(SessionLocal, "short_url")
+    permutation = None
+    if settings.SHORT_TAG_SECRET:
+        permutation = FeistelPermutation(settings.SHORT_TAG_SECRET)
+    return ShortTagAllocator(
+        source,
+        block_size=settings.SHORT_ID_BLOCK_SIZE,
+        min_length=settings.SHORT_TAG_MIN_LENGTH,
+        permutation=permutation,
+    )
+
+
+short_tag_allocator = _create_allocator()
@@ -1,4 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, SmallInteger, BigInteger, String, DateTime, Index, func, text
 
 from ..infra import Base
 
@@ -8,18 +12,114 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String(20))
-    password = Column(String(32))
+    password = Column(String(128))
     created_at = Column(DateTime, default=func.now())
 
 
 class ShortUrl(Base):
     __tablename__ = "short_url"
+    __table_args__ = (
+        # 按用户 keyset 分页 / 导出: WHERE created_by = ? AND id > ? ORDER BY id
+        Index("ix_short_url_created_by_id", "created_by", "id"),
+        # 过期清理只扫描设置了过期时间的行, 永久短链不进索引
+        Index(
+            "ix_short_url_expires_at",
+            "expires_at",
+            postgresql_where=text("expires_at IS NOT NULL"),
+            sqlite_where=text("expires_at IS NOT NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    short_tag = Column(String(20), nullable=False)
+    short_tag = Column(String(20), nullable=False, unique=True, index=True)
     short_url = Column(String)
     long_url = Column(String, nullable=False)
     visits_count = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=func.now())
     created_by = Column(String(20))
-    msg_content = Column(String, nullable=False)
\ No newline at end of file
+    msg_content = Column(String, nullable=False)
+    # 过期时间 (UTC), 为空表示永不过期
+    expires_at = Column(DateTime, nullable=True)
+
+
+class ShortUrlStats(Base):
+    """按小时汇总的点击统计, 由点击事件流的消费者批量 upsert。"""
+
+    __tablename__ = "short_url_stats"
+
+    short_url_id = Column(Integer, primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    referrer = Column(String(255), primary_key=True, default="")
+    ua_family = Column(String(20), primary_key=True, default="")
+    country = Column(String(2), primary_key=True, default="")
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
+class ShortUrlVisitShard(Base):
+    """
+    热点短链的分片访问计数。
+
+    热点短链的访问数不直接累加到 short_url.visits_count 这一行上, 而是分散到 K 个子计数行,
+    读取时与 visits_count 相加, 后台定期合并回 short_url。
+    """
+
+    __tablename__ = "short_url_visit_shard"
+
+    short_url_id = Column(Integer, primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    visits = Column(BigInteger, nullable=False, default=0)
+
+
+class IdAllocator(Base):
+    """号段分配表, 每个 worker 一次租用 [next_id, next_id + block_size) 一整段 ID。"""
+
+    __tablename__ = "short_url_id_allocator"
+
+    name = Column(String(32), primary_key=True)
+    next_id = Column(BigInteger, nullable=False)
+
+
+@dataclass
+class ShortUrlRecord:
+    """重定向需要的最小字段, 可以 JSON 序列化后放进缓存。"""
+
+    id: int
+    short_tag: str
+    long_url: str
+    # 过期时间的 unix 时间戳, 为空表示永不过期
+    expires_at: float | None = None
+
+    @classmethod
+    def from_orm(cls, short_url: ShortUrl) -> "ShortUrlRecord":
+        return cls(
+            id=short_url.id,
+            short_tag=short_url.short_tag,
+            long_url=short_url.long_url,
+            expires_at=to_timestamp(short_url.expires_at),
+        )
+
+    def ttl(self) -> float | None:
+        """距离过期还剩多少秒, 永不过期时返回 None。"""
+        return remaining_ttl(self.expires_at)
+
+    def is_expired(self) -> bool:
+        return is_expired(self.expires_at)
+
+
+def utc_now() -> datetime:
+    """与 expires_at 列比较用的当前时间 (naive UTC)。"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_timestamp(expires_at: datetime | None) -> float | None:
+    if expires_at is None:
+        return None
+    return expires_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def remaining_ttl(expires_at: float | None) -> float | None:
+    return None if expires_at is None else expires_at - time.time()
+
+
+def is_expired(expires_at: float | None) -> bool:
+    return expires_at is not None and expires_at <= time.time()
@@ -1,8 +1,24 @@
 
+import random
+from collections import Counter
+from dataclasses import asdict
+from datetime import datetime
+from typing import TYPE_CHECKING
+
 from fastapi import Depends
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, insert, update, delete, func, values, column, bindparam, or_, Integer
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from .models import User, ShortUrl
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import (
+    User, ShortUrl, ShortUrlRecord, ShortUrlStats, ShortUrlVisitShard,
+    utc_now, remaining_ttl, is_expired,
+)
+from ..infra.cache import TwoTierCache
+
+if TYPE_CHECKING:
+    from .tag_filter import ShortTagFilter
 
 import threading
 
@@ -56,20 +72,108 @@ class UserService:
 
 class ShortService:
     
-    def __init__(self, db: AsyncSession):
+    def __init__(
+        self,
+        db: AsyncSession,
+        cache: TwoTierCache | None = None,
+        tag_filter: "ShortTagFilter | None" = None,
+    ):
         self.db = db
+        self.cache = cache
+        self.tag_filter = tag_filter
     
-    async def get_short_url(self, short_tag: str):
+    async def get_short_url(self, short_tag: str) -> ShortUrlRecord | None:
+        """重定向用的查询, 已过期但还没被清理掉的短链视为不存在。"""
+        if not self.cache:
+            record = await self._load_short_url(short_tag)
+            return None if record is None or record.is_expired() else record
+        data = await self.cache.get_or_load(
+            short_tag,
+            lambda: self._load_short_url_data(short_tag),
+            # 缓存不能比短链活得更久
+            ttl=lambda data: remaining_ttl(data.get("expires_at")),
+        )
+        if not data or is_expired(data.get("expires_at")):
+            return None
+        return ShortUrlRecord(**data)
+
+    async def _load_short_url(self, short_tag: str) -> ShortUrlRecord | None:
         result = await self.db.execute(select(ShortUrl).where(ShortUrl.short_tag == short_tag))
-        return result.scalars().first()
+        short_url = result.scalars().first()
+        return ShortUrlRecord.from_orm(short_url) if short_url else None
+
+    async def _load_short_url_data(self, short_tag: str) -> dict | None:
+        record = await self._load_short_url(short_tag)
+        return asdict(record) if record else None
     
+    async def get_top_short_urls(self, limit: int) -> list[ShortUrlRecord]:
+        stmt = (
+            select(ShortUrl)
+            .where(or_(ShortUrl.expires_at.is_(None), ShortUrl.expires_at > utc_now()))
+            .order_by(func.coalesce(ShortUrl.visits_count, 0).desc())
+            .limit(limit)
+        )
+        result = await self.db.execute(stmt)
+        return [ShortUrlRecord.from_orm(short_url) for short_url in result.scalars()]
+
+    async def list_short_urls(
+        self, created_by: str, after_id: int | None = None, limit: int = 50
+    ) -> list[ShortUrl]:
+        """按 (created_by, id) keyset 分页, 不使用 OFFSET。"""
+        stmt = select(ShortUrl).where(ShortUrl.created_by == created_by)
+        if after_id is not None:
+            stmt = stmt.where(ShortUrl.id > after_id)
+        result = await self.db.execute(stmt.order_by(ShortUrl.id).limit(limit))
+        rows = result.scalars().all()
+        # 热点短链还没合并回来的子计数, 只改读到的值, 不标记为待写回
+        shard_visits = await self._shard_visits([row.id for row in rows])
+        for row in rows:
+            if row.id in shard_visits:
+                set_committed_value(
+                    row, "visits_count", (row.visits_count or 0) + shard_visits[row.id]
+                )
+        return rows
+
+    async def stream_short_urls(self, created_by: str, batch_size: int = 1000):
+        """服务端游标逐批读取某个用户的全部短链, 内存占用与总行数无关。"""
+        shard_visits = func.coalesce(
+            select(func.sum(ShortUrlVisitShard.visits))
+            .where(ShortUrlVisitShard.short_url_id == ShortUrl.id)
+            .scalar_subquery(),
+            0,
+        )
+        stmt = (
+            select(
+                ShortUrl.id,
+                ShortUrl.short_tag,
+                ShortUrl.short_url,
+                ShortUrl.long_url,
+                (func.coalesce(ShortUrl.visits_count, 0) + shard_visits).label("visits_count"),
+                ShortUrl.created_at,
+                ShortUrl.expires_at,
+            )
+            .where(ShortUrl.created_by == created_by)
+            .order_by(ShortUrl.id)
+            .execution_options(yield_per=batch_size)
+        )
+        result = await self.db.stream(stmt)
+        async for rows in result.partitions():
+            yield rows
+
     async def create_short_url(self, **kwargs):
         new_short_url = ShortUrl(
             **kwargs
         )
         self.db.add(new_short_url)
-        await self.db.commit()
+        try:
+            await self.db.commit()
+        except IntegrityError:
+            # short_tag 唯一索引冲突, 交给调用方换一个 tag 重试
+            await self.db.rollback()
+            raise
         await self.db.refresh(new_short_url)
+        if self.tag_filter:
+            await self.tag_filter.add([new_short_url.short_tag])
         return new_short_url
     
     async def update_short_url(self, short_url_id: int, **kwargs):
@@ -77,19 +181,199 @@ class ShortService:
         stmt = stmt.values(**kwargs)
         result = await self.db.execute(stmt.returning(ShortUrl))
         await self.db.commit()
-        return result.scalars().first()
+        short_url = result.scalars().first()
+        if short_url and self.cache:
+            await self.cache.invalidate(short_url.short_tag)
+        return short_url
+
+    async def bulk_increment_visits(
+        self,
+        counts: dict[int, int],
+        sharded: dict[int, int] | None = None,
+        shards: int = 16,
+    ):
+        """
+        把一批访问计数累加到数据库, 一个事务提交。
+
+        counts 用一条批量 UPDATE 累加到 short_url.visits_count;
+        sharded 是热点短链的计数, 每个短链随机写入一个子计数行, 避免多个 worker 争同一行锁。
+        """
+        if not counts and not sharded:
+            return
+        if counts:
+            await self._increment_visits(counts)
+        if sharded:
+            await self._increment_visit_shards(sharded, shards)
+        await self.db.commit()
+
+    async def _increment_visits(self, counts: dict[int, int]):
+        if self.db.get_bind().dialect.name == "postgresql":
+            # UPDATE short_url SET visits_count = visits_count + v.n FROM (VALUES ...) AS v (id, n)
+            v = values(
+                column("id", Integer), column("n", Integer), name="v"
+            ).data(list(counts.items()))
+            stmt = (
+                update(ShortUrl)
+                .where(ShortUrl.id == v.c.id)
+                .values(visits_count=func.coalesce(ShortUrl.visits_count, 0) + v.c.n)
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.execute(stmt)
+        else:
+            # sqlite 不支持 VALUES 的列别名, 退化为同一事务内的 executemany
+            table = ShortUrl.__table__
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("_id"))
+                .values(visits_count=func.coalesce(table.c.visits_count, 0) + bindparam("_n"))
+            )
+            await self.db.execute(
+                stmt, [{"_id": short_url_id, "_n": n} for short_url_id, n in counts.items()]
+            )
+
+    async def _increment_visit_shards(self, counts: dict[int, int], shards: int):
+        dialect = postgresql if self.db.get_bind().dialect.name == "postgresql" else sqlite
+        rows = [
+            {"short_url_id": short_url_id, "shard": random.randrange(shards), "visits": n}
+            for short_url_id, n in counts.items()
+        ]
+        stmt = dialect.insert(ShortUrlVisitShard).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ShortUrlVisitShard.short_url_id, ShortUrlVisitShard.shard],
+            set_={"visits": ShortUrlVisitShard.visits + stmt.excluded.visits},
+        )
+        await self.db.execute(stmt)
+
+    async def fold_visit_shards(self) -> int:
+        """
+        把子计数合并回 short_url.visits_count, 返回合并的短链数。
+
+        DELETE ... RETURNING 取走的就是被删掉的值, 和其他 worker 并发写入子计数时不会丢计数。
+        """
+        result = await self.db.execute(
+            delete(ShortUrlVisitShard).returning(
+                ShortUrlVisitShard.short_url_id, ShortUrlVisitShard.visits
+            )
+        )
+        totals: Counter[int] = Counter()
+        for short_url_id, visits in result:
+            totals[short_url_id] += visits
+        if totals:
+            await self._increment_visits(dict(totals))
+        await self.db.commit()
+        return len(totals)
+
+    async def _shard_visits(self, short_url_ids: list[int]) -> dict[int, int]:
+        if not short_url_ids:
+            return {}
+        result = await self.db.execute(
+            select(ShortUrlVisitShard.short_url_id, func.sum(ShortUrlVisitShard.visits))
+            .where(ShortUrlVisitShard.short_url_id.in_(short_url_ids))
+            .group_by(ShortUrlVisitShard.short_url_id)
+        )
+        return {short_url_id: int(visits) for short_url_id, visits in result}
 
     async def delete_short_url(self, short_url_id: int):
         stmt = delete(ShortUrl).where(ShortUrl.id == short_url_id)
-        result = await self.db.execute(stmt)
+        result = await self.db.execute(stmt.returning(ShortUrl.short_tag))
         await self.db.commit()
-        return result.rowcount > 0
+        short_tags = result.scalars().all()
+        if self.cache:
+            for short_tag in short_tags:
+                await self.cache.invalidate(short_tag)
+        return len(short_tags) > 0
+
+    async def delete_expired_short_urls(self, limit: int) -> list[str]:
+        """
+        删除最多 limit 条已过期的短链及其小时汇总, 返回被删除的 short_tag。
+
+        DELETE ... WHERE id IN (SELECT id ... LIMIT n) 让每个事务只锁一小批行;
+        PostgreSQL 下 SKIP LOCKED 让多个 worker 同时清理时互不等待。
+        """
+        ids = (
+            select(ShortUrl.id)
+            .where(ShortUrl.expires_at.is_not(None), ShortUrl.expires_at <= utc_now())
+            .order_by(ShortUrl.expires_at)
+            .limit(limit)
+        )
+        if self.db.get_bind().dialect.name == "postgresql":
+            ids = ids.with_for_update(skip_locked=True)
+        stmt = delete(ShortUrl).where(ShortUrl.id.in_(ids)).returning(ShortUrl.id, ShortUrl.short_tag)
+        rows = (await self.db.execute(stmt)).all()
+        if rows:
+            ids = [row.id for row in rows]
+            await self.db.execute(delete(ShortUrlStats).where(ShortUrlStats.short_url_id.in_(ids)))
+            await self.db.execute(
+                delete(ShortUrlVisitShard).where(ShortUrlVisitShard.short_url_id.in_(ids))
+            )
+        await self.db.commit()
+        short_tags = [row.short_tag for row in rows]
+        if self.cache:
+            for short_tag in short_tags:
+                await self.cache.invalidate(short_tag)
+        return short_tags
     
     async def create_batch_short_urls(self, short_urls: list[dict]):
-        new_short_urls = [ShortUrl(**data) for data in short_urls]
-        self.db.add_all(new_short_urls)
+        """一条多行 INSERT ... RETURNING 写入一批短链, 不再逐行 refresh。"""
+        if not short_urls:
+            return []
+        stmt = insert(ShortUrl).values(short_urls).returning(ShortUrl.id, ShortUrl.short_tag)
+        try:
+            result = await self.db.execute(stmt)
+            rows = result.all()
+            await self.db.commit()
+        except IntegrityError:
+            await self.db.rollback()
+            raise
+        if self.tag_filter:
+            await self.tag_filter.add([row.short_tag for row in rows])
+        return rows
+
+
+class StatsService:
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def upsert_hourly_stats(self, rows: list[dict]):
+        """批量累加小时汇总, 已存在的行 clicks 相加。"""
+        if not rows:
+            return
+        dialect = postgresql if self.db.get_bind().dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(ShortUrlStats).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                ShortUrlStats.short_url_id,
+                ShortUrlStats.hour,
+                ShortUrlStats.referrer,
+                ShortUrlStats.ua_family,
+                ShortUrlStats.country,
+            ],
+            set_={"clicks": ShortUrlStats.clicks + stmt.excluded.clicks},
+        )
+        await self.db.execute(stmt)
         await self.db.commit()
-        for short_url in new_short_urls:
-            await self.db.refresh(short_url)
-        return new_short_urls
-    
\ No newline at end of file
+
+    async def get_hourly_stats(
+        self,
+        short_tag: str,
+        created_by: str,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[ShortUrlStats] | None:
+        """查询某个短链的小时汇总; 短链不存在或不属于 created_by 时返回 None。"""
+        result = await self.db.execute(
+            select(ShortUrl.id).where(
+                ShortUrl.short_tag == short_tag, ShortUrl.created_by == created_by
+            )
+        )
+        short_url_id = result.scalar()
+        if short_url_id is None:
+            return None
+        stmt = select(ShortUrlStats).where(ShortUrlStats.short_url_id == short_url_id)
+        if start:
+            stmt = stmt.where(ShortUrlStats.hour >= start)
+        if end:
+            stmt = stmt.where(ShortUrlStats.hour < end)
+        result = await self.db.execute(stmt.order_by(ShortUrlStats.hour))
+        return result.scalars().all()
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError, TimeoutError as RedisTimeoutError
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .models import ShortUrl
+from ..infra import SessionLocal, redis_client, get_settings
+from ..infra.bloom import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+class ShortTagFilter:
+    """
+    已知 short_tag 的 Bloom filter, 用来在打开数据库会话之前拒绝不存在的 tag。
+
+    启动时流式扫描 short_url 表构建, 新建短链时本地加入并通过 Redis pub/sub 通知其他 worker。
+    和 Redis 断线后以及每隔 rebuild_interval 秒都会从数据库重建, 以补上可能错过的通知;
+    还没构建好 (或者没有启动) 时放行所有请求。没有 Redis 时各 worker 之间无法同步, 应用不会启动它。
+
+    通知发送失败的 tag 先记下来, 后台按退避间隔重发, 直到 Redis 恢复; 积压超过 max_unpublished 时
+    丢弃, 其他 worker 靠定期重建补上。
+    """
+
+    channel = "short_url:bloom:add"
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        redis: Redis | None,
+        error_rate: float = 0.001,
+        min_capacity: int = 100000,
+        rebuild_interval: float = 600.0,
+        max_unpublished: int = 100000,
+    ):
+        self.session_factory = session_factory
+        self.redis = redis
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self.rebuild_interval = rebuild_interval
+        self.max_unpublished = max_unpublished
+        self.bloom: BloomFilter | None = None
+        self.rejected = 0
+        # 重建期间新加入的 tag, 重建完成后补进新的 filter
+        self._rebuild_pending: list[str] | None = None
+        self._rebuild_lock = asyncio.Lock()
+        self._pubsub: PubSub | None = None
+        self._tasks: list[asyncio.Task] = []
+        # 还没通知到其他 worker 的 tag 和负责重发的任务
+        self._unpublished: list[str] = []
+        self._retry_task: asyncio.Task | None = None
+
+    def might_contain(self, short_tag: str) -> bool:
+        if self.bloom is None or short_tag in self.bloom:
+            return True
+        self.rejected += 1
+        return False
+
+    def _add_local(self, short_tags: list[str]):
+        if self.bloom is not None:
+            for short_tag in short_tags:
+                self.bloom.add(short_tag)
+        if self._rebuild_pending is not None:
+            self._rebuild_pending.extend(short_tags)
+
+    async def add(self, short_tags: list[str]):
+        self._add_local(short_tags)
+        if self.redis and short_tags:
+            self._unpublished.extend(short_tags)
+            if not self._retry_task:
+                await self._publish()
+
+    async def _publish(self) -> bool:
+        """把积压的 tag 通知给其他 worker, 失败时留着等重发。"""
+        short_tags, self._unpublished = self._unpublished, []
+        if not short_tags:
+            return True
+        try:
+            await self.redis.publish(self.channel, "\n".join(short_tags))
+            return True
+        except RedisError as e:
+            self._unpublished = short_tags + self._unpublished
+            if len(self._unpublished) > self.max_unpublished:
+                logger.error(
+                    "Bloom filter dropped %d unpublished short tags, other workers pick them up on rebuild",
+                    len(self._unpublished),
+                )
+                self._unpublished = []
+            else:
+                logger.warning("Bloom filter publish of %d short tags failed, will retry: %s", len(short_tags), e)
+            if not self._retry_task and self._unpublished:
+                self._retry_task = asyncio.create_task(self._retry_publish())
+            return False
+
+    async def _retry_publish(self):
+        delay = 0.5
+        try:
+            # 重发期间 add() 只积压不发送, 直到全部发出去为止
+            while self._unpublished:
+                await asyncio.sleep(delay)
+                delay = 0.5 if await self._publish() else min(delay * 2, 10.0)
+        finally:
+            self._retry_task = None
+
+    async def rebuild(self):
+        async with self._rebuild_lock:
+            self._rebuild_pending = []
+            try:
+                async with self.session_factory() as db:
+                    total = (await db.execute(select(func.count(ShortUrl.id)))).scalar() or 0
+                    # 留一倍余量, 到下次重建之前误判率不会明显上升
+                    bloom = BloomFilter(max(total * 2, self.min_capacity), self.error_rate)
+                    result = await db.stream_scalars(
+                        select(ShortUrl.short_tag).execution_options(yield_per=10000)
+                    )
+                    async for short_tag in result:
+                        bloom.add(short_tag)
+                for short_tag in self._rebuild_pending:
+                    bloom.add(short_tag)
+                self.bloom = bloom
+                logger.info("Bloom filter built with %d short tags.", bloom.count)
+            finally:
+                self._rebuild_pending = None
+
+    async def start(self):
+        if self.redis:
+            self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            # 先订阅再扫描, 扫描期间创建的 tag 不会漏掉
+            await self._pubsub.subscribe(self.channel)
+            self._tasks.append(asyncio.create_task(self._listen()))
+        await self.rebuild()
+        if self.rebuild_interval > 0:
+            self._tasks.append(asyncio.create_task(self._periodic_rebuild()))
+
+    async def stop(self):
+        tasks = self._tasks + ([self._retry_task] if self._retry_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._retry_task = None
+        if self._pubsub:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def _periodic_rebuild(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.warning("Bloom filter rebuild failed: %s", e)
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        self._add_local(message["data"].split("\n"))
+            except (RedisTimeoutError, TimeoutError):
+                continue
+            except RedisError as e:
+                # 断线期间可能漏掉了新 tag, 先重新订阅再从数据库重建
+                logger.warning("Bloom filter listener error: %s", e)
+                await asyncio.sleep(1)
+                try:
+                    await self._pubsub.subscribe(self.channel)
+                    await self.rebuild()
+                except Exception as e:
+                    logger.warning("Bloom filter rebuild failed: %s", e)
+
+
+short_tag_filter = ShortTagFilter(
+    SessionLocal,
+    redis_client,
+    error_rate=get_settings().BLOOM_ERROR_RATE,
+    min_capacity=get_settings().BLOOM_MIN_CAPACITY,
+    rebuild_interval=get_settings().BLOOM_REBUILD_INTERVAL,
+)
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import Counter
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .service import ShortService
+from ..infra import SessionLocal, get_settings
+from ..infra.sketch import HotKeyDetector
+
+
+class VisitAccumulator:
+    """
+    Write-behind 访问计数器。
+
+    重定向时只在内存里累加, 后台任务按固定间隔把累计值用一条批量 UPDATE 写回数据库,
+    应用关闭时再做最后一次 flush。
+
+    传入 hot_keys 时, 被判定为热点的短链写到 shards 个子计数行里, 每 fold_interval 秒
+    合并回主表一次, 这样多个 worker 不会在同一行上排队。
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        flush_interval: float = 1.0,
+        hot_keys: HotKeyDetector | None = None,
+        shards: int = 16,
+        fold_interval: float = 30.0,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.hot_keys = hot_keys
+        self.shards = shards
+        self.fold_interval = fold_interval
+        self._pending: Counter[int] = Counter()
+        self._pending_hot: Counter[int] = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._next_fold = time.monotonic() + fold_interval
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + len(self._pending_hot)
+
+    def incr(self, short_url_id: int, n: int = 1):
+        if self.hot_keys and self.hot_keys.hit(str(short_url_id), n):
+            self._pending_hot[short_url_id] += n
+        else:
+            self._pending[short_url_id] += n
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending and not self._pending_hot:
+                return
+            counts, self._pending = self._pending, Counter()
+            hot, self._pending_hot = self._pending_hot, Counter()
+            try:
+                async with self.session_factory() as db:
+                    await ShortService(db).bulk_increment_visits(
+                        dict(counts), sharded=dict(hot), shards=self.shards
+                    )
+            except Exception as e:
+                # 写库失败时把计数放回去, 下次再试
+                print(f"Flush visits failed: {e}")
+                self._pending.update(counts)
+                self._pending_hot.update(hot)
+
+    async def fold(self):
+        """把热点短链的子计数合并回 short_url.visits_count。"""
+        self._next_fold = time.monotonic() + self.fold_interval
+        try:
+            async with self.session_factory() as db:
+                await ShortService(db).fold_visit_shards()
+        except Exception as e:
+            # 子计数留在表里, 下次再合并
+            print(f"Fold visit shards failed: {e}")
+
+    async def start(self):
+        if not self._flush_task:
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self.hot_keys:
+            await self.fold()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # shield: 关闭时取消任务不能打断正在进行的写库
+            await asyncio.shield(self.flush())
+            if self.hot_keys and time.monotonic() >= self._next_fold:
+                await asyncio.shield(self.fold())
+
+
+visit_counter = VisitAccumulator(
+    SessionLocal,
+    flush_interval=get_settings().VISITS_FLUSH_INTERVAL,
+    hot_keys=HotKeyDetector(
+        threshold=get_settings().HOT_KEY_THRESHOLD, window=get_settings().HOT_KEY_WINDOW
+    ),
+    shards=get_settings().HOT_KEY_SHARDS,
+    fold_interval=get_settings().VISIT_SHARD_FOLD_INTERVAL,
+)
@@ -5,6 +5,57 @@ from functools import lru_cache
 class Settings(BaseSettings):
     ASYNC_DATABASE_URL: str = "sqlite+aiosqlite:///./short.db"
     TOKEN_SIGN_SECRET: str = "abc123!@#"
+    # 已验证 JWT 缓存的容量
+    TOKEN_CACHE_MAXSIZE: int = 1024
+
+    # redis is optional, without it the redirect cache is process-local only
+    REDIS_URL: str | None = None
+
+    # redirect cache
+    CACHE_LOCAL_MAXSIZE: int = 10000
+    CACHE_LOCAL_TTL: float = 60.0
+    CACHE_REDIS_TTL: int = 3600
+    # 启动时预热访问量最高的 N 个短链, 0 表示不预热
+    CACHE_PRELOAD_TOP_N: int = 1000
+
+    # 访问计数 write-behind 的 flush 间隔(秒)
+    VISITS_FLUSH_INTERVAL: float = 1.0
+    # 热点短链: 每个 worker 在 HOT_KEY_WINDOW 秒内访问达到 HOT_KEY_THRESHOLD 次即视为热点,
+    # 计数改为写入 HOT_KEY_SHARDS 个子计数行, 每 VISIT_SHARD_FOLD_INTERVAL 秒合并回主表
+    HOT_KEY_THRESHOLD: int = 1000
+    HOT_KEY_WINDOW: float = 10.0
+    HOT_KEY_SHARDS: int = 16
+    VISIT_SHARD_FOLD_INTERVAL: float = 30.0
+
+    # short_tag 生成: 号段来源 db / redis, 每次租用的号段大小,
+    # tag 最小长度, 以及可选的 Feistel 置换密钥(为空则不置换)
+    SHORT_ID_SOURCE: str = "db"
+    SHORT_ID_BLOCK_SIZE: int = 1000
+    SHORT_TAG_MIN_LENGTH: int = 6
+    SHORT_TAG_SECRET: str | None = None
+
+    # 批量创建时每条 INSERT 的行数
+    BULK_INSERT_CHUNK_SIZE: int = 1000
+
+    # 未知 tag 的 Bloom filter 拦截; 需要 Redis 同步各 worker 新建的 tag, 没有配置 REDIS_URL 时不启用
+    BLOOM_FILTER_ENABLED: bool = True
+    BLOOM_ERROR_RATE: float = 0.001
+    BLOOM_MIN_CAPACITY: int = 100000
+    BLOOM_REBUILD_INTERVAL: float = 600.0
+
+    # GET /{short_tag} 走 ASGI 快速通道, 不经过 FastAPI 路由
+    FAST_REDIRECT_ENABLED: bool = True
+
+    # 点击分析 (需要 Redis): stream 最大长度, XADD 批量间隔, 汇总每批读取的事件数
+    ANALYTICS_STREAM_MAXLEN: int = 1000000
+    ANALYTICS_FLUSH_INTERVAL: float = 0.5
+    ANALYTICS_BATCH_SIZE: int = 500
+
+    # 过期短链清理: 扫描间隔(秒), 每批删除的行数, 批与批之间的停顿(秒)
+    EXPIRY_SWEEP_ENABLED: bool = True
+    EXPIRY_SWEEP_INTERVAL: float = 60.0
+    EXPIRY_SWEEP_BATCH_SIZE: int = 500
+    EXPIRY_SWEEP_BATCH_PAUSE: float = 0.1
 
 @lru_cache
 def get_settings() -> Settings:
@@ -16,12 +67,38 @@ from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
+from redis.asyncio import ConnectionPool, Redis
+
 
 async_engine = create_async_engine(get_settings().ASYNC_DATABASE_URL, echo=False)
 
 
 SessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 
+
+redis_client: Redis | None = None
+if get_settings().REDIS_URL:
+    redis_pool = ConnectionPool.from_url(
+        get_settings().REDIS_URL,
+        decode_responses=True,
+        socket_connect_timeout=5,
+        socket_timeout=5,
+    )
+    redis_client = Redis(connection_pool=redis_pool)
+
+
+from .cache import LRUCache, TwoTierCache
+
+short_url_cache = TwoTierCache(
+    redis_client,
+    LRUCache(
+        maxsize=get_settings().CACHE_LOCAL_MAXSIZE,
+        ttl=get_settings().CACHE_LOCAL_TTL,
+    ),
+    prefix="short_url:tag",
+    redis_ttl=get_settings().CACHE_REDIS_TTL,
+)
+
 from fastapi_book import Base
 
-all = ["Base", "SessionLocal", "get_settings", "async_engine"]
\ No newline at end of file
+all = ["Base", "SessionLocal", "get_settings", "async_engine", "redis_client", "short_url_cache"]
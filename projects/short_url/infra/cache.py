@@ -0,0 +1,179 @@
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError, TimeoutError as RedisTimeoutError
+
+
+class LRUCache:
+    """进程内的 LRU 缓存, 容量有上限, 每个条目有 TTL。"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expire_at, value = item
+        if expire_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+@dataclass
+class CacheStats:
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        total = self.local_hits + self.redis_hits + self.misses
+        data["hit_ratio"] = (self.local_hits + self.redis_hits) / total if total else 0.0
+        return data
+
+
+class TwoTierCache:
+    """
+    两级 read-through 缓存: 进程内 LRU + Redis。
+
+    值必须可以 JSON 序列化。更新/删除时通过 Redis pub/sub 通知其他 worker 清理本地缓存。
+    没有配置 Redis 时退化为只有进程内缓存。
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None,
+        local: LRUCache,
+        prefix: str,
+        redis_ttl: int = 3600,
+    ):
+        self.redis = redis
+        self.local = local
+        self.prefix = prefix
+        self.redis_ttl = redis_ttl
+        self.stats = CacheStats()
+        self._pubsub: PubSub | None = None
+        self._listen_task: asyncio.Task | None = None
+
+    @property
+    def invalidate_channel(self) -> str:
+        return f"{self.prefix}:invalidate"
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get(self, key: str) -> Any | None:
+        value = self.local.get(key)
+        if value is not None:
+            self.stats.local_hits += 1
+            return value
+
+        if self.redis:
+            try:
+                raw = await self.redis.get(self._key(key))
+            except RedisError as e:
+                print(f"Redis cache get failed: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+                self.stats.redis_hits += 1
+                return value
+
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        """ttl 只能缩短两级缓存各自的默认 TTL, 用于会过期的值; ttl <= 0 时不缓存。"""
+        if ttl is not None and ttl <= 0:
+            return
+        self.local.set(key, value, ttl=None if ttl is None else min(ttl, self.local.ttl))
+        if self.redis:
+            ex = self.redis_ttl if ttl is None else min(math.ceil(ttl), self.redis_ttl)
+            try:
+                await self.redis.set(self._key(key), json.dumps(value), ex=ex)
+            except RedisError as e:
+                print(f"Redis cache set failed: {e}")
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any | None]],
+        ttl: Callable[[Any], float | None] | None = None,
+    ) -> Any | None:
+        value = await self.get(key)
+        if value is None:
+            value = await loader()
+            if value is not None:
+                await self.set(key, value, ttl=ttl(value) if ttl else None)
+        return value
+
+    async def invalidate(self, key: str):
+        self.local.delete(key)
+        if self.redis:
+            try:
+                await self.redis.delete(self._key(key))
+                await self.redis.publish(self.invalidate_channel, key)
+            except RedisError as e:
+                print(f"Redis cache invalidate failed: {e}")
+
+    async def start(self):
+        if not self.redis or self._listen_task:
+            return
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.invalidate_channel)
+        self._listen_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listen_task:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+        if self._pubsub:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        self.local.delete(message["data"])
+            except (RedisTimeoutError, TimeoutError):
+                # 空闲时读超时, 继续等待即可
+                continue
+            except RedisError as e:
+                # 断线期间可能错过了失效通知, 清空本地缓存
+                print(f"Cache invalidation listener error: {e}")
+                self.local.clear()
+                await asyncio.sleep(1)
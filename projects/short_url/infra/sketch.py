@@ -0,0 +1,78 @@
+import hashlib
+import time
+from array import array
+
+
+class CountMinSketch:
+    """
+    Count-min sketch, 用固定大小的 depth x width 计数矩阵估计 key 的出现次数。
+
+    估计值只会偏高不会偏低; 每行的位置和 BloomFilter 一样用 blake2b 的 double hashing 生成。
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        if width <= 0 or depth <= 0:
+            raise ValueError("width and depth must be positive")
+        self.width = width
+        self.depth = depth
+        self._rows = [array("Q", bytes(8 * width)) for _ in range(depth)]
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.depth):
+            yield (h1 + i * h2) % self.width
+
+    def add(self, key: str, n: int = 1) -> int:
+        """累加并返回累加后的估计值。"""
+        estimate = None
+        for row, pos in zip(self._rows, self._positions(key)):
+            row[pos] += n
+            if estimate is None or row[pos] < estimate:
+                estimate = row[pos]
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[pos] for row, pos in zip(self._rows, self._positions(key)))
+
+    def decay(self):
+        """所有计数减半, 让估计值只反映最近的访问。"""
+        for row in self._rows:
+            for i in range(self.width):
+                row[i] >>= 1
+
+
+class HotKeyDetector:
+    """
+    基于 count-min sketch 的热点 key 检测。
+
+    每个 window 秒衰减一次, 近期估计访问量达到 threshold 的 key 进入热点集合;
+    衰减后低于 threshold / 2 才移出, 避免在阈值附近来回切换。
+    """
+
+    def __init__(self, threshold: int, window: float = 10.0, width: int = 2048, depth: int = 4):
+        self.threshold = threshold
+        self.window = window
+        self.sketch = CountMinSketch(width, depth)
+        self.hot: set[str] = set()
+        self._next_decay = time.monotonic() + window
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.hot
+
+    def hit(self, key: str, n: int = 1) -> bool:
+        """记录一次访问, 返回 key 当前是否是热点。"""
+        now = time.monotonic()
+        if now >= self._next_decay:
+            self._decay()
+            self._next_decay = now + self.window
+        estimate = self.sketch.add(key, n)
+        if key not in self.hot and estimate >= self.threshold:
+            self.hot.add(key)
+            print(f"Hot key detected: {key}")
+        return key in self.hot
+
+    def _decay(self):
+        self.sketch.decay()
+        self.hot = {key for key in self.hot if self.sketch.estimate(key) >= self.threshold // 2}
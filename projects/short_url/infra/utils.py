@@ -1,25 +1,26 @@
-import random
+import hashlib
 import string
+import time
 from jose import jwt, JWTError
 
-from passlib.context import CryptContext
+from fastapi_book.infra import password_hasher
 
 from . import get_settings
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .cache import LRUCache
 
 SECRET_KEY = get_settings().TOKEN_SIGN_SECRET
 ALGORITHM = "HS256"
 
 class PasslibHelper:
+    """bcrypt 在共享的线程池里执行, 不阻塞事件循环。"""
 
     @staticmethod
-    def hash_password(plain_password: str) -> str:
-        return pwd_context.hash(plain_password)
+    async def hash_password(plain_password: str) -> str:
+        return await password_hasher.hash_password(plain_password)
 
     @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(plain_password: str, hashed_password: str) -> bool:
+        return await password_hasher.verify_password(plain_password, hashed_password)
     
 
 class AuthTokenHelper:
@@ -37,15 +38,98 @@ class AuthTokenHelper:
             return None
 
 
-def generate_short_url(length: int = 6) -> str:
+BASE62_ALPHABET = string.digits + string.ascii_lowercase + string.ascii_uppercase
+
+
+class VerifiedTokenCache:
     """
-    Generate a random short URL string.
-    
+    已验证 JWT 的缓存, key 是 token 的摘要, 条目在 token 的 exp 时刻过期。
+
+    同一个 token 在有效期内只验签、解析一次。返回的是缓存内容的副本, 调用方修改不会影响缓存。
+    """
+
+    def __init__(self, maxsize: int = 1024, default_ttl: float = 300.0):
+        self._cache = LRUCache(maxsize=maxsize, ttl=default_ttl)
+
+    def decode(self, token: str) -> dict | None:
+        key = hashlib.sha256(token.encode()).hexdigest()
+        payload = self._cache.get(key)
+        if payload is not None:
+            return dict(payload)
+        payload = AuthTokenHelper.token_decode(token)
+        if payload:
+            exp = payload.get("exp")
+            ttl = exp - time.time() if exp is not None else None
+            if ttl is None or ttl > 0:
+                self._cache.set(key, payload, ttl=ttl)
+            return dict(payload)
+        return payload
+
+
+verified_token_cache = VerifiedTokenCache(maxsize=get_settings().TOKEN_CACHE_MAXSIZE)
+
+
+def base62_encode(num: int, min_length: int = 1) -> str:
+    """
+    Encode a non-negative integer as base62.
+
     Args:
-        length (int): The length of the short URL string. Default is 6.
-        
+        num (int): The number to encode.
+        min_length (int): Left-pad the result with '0' up to this length.
+
     Returns:
-        str: A random string containing alphanumeric characters.
+        str: The base62 string.
+    """
+    if num < 0:
+        raise ValueError("num must be non-negative")
+    chars = []
+    while num:
+        num, rem = divmod(num, 62)
+        chars.append(BASE62_ALPHABET[rem])
+    return "".join(reversed(chars)).rjust(min_length, BASE62_ALPHABET[0])
+
+
+def base62_decode(text: str) -> int:
+    num = 0
+    for char in text:
+        num = num * 62 + BASE62_ALPHABET.index(char)
+    return num
+
+
+class FeistelPermutation:
     """
-    characters = string.ascii_letters + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
\ No newline at end of file
+    用 Feistel 网络对整数的低 bits 位做可逆置换, 让连续的 ID 编码出来的 tag 不可猜测。
+
+    高位保持不变, 所以这是整个 64 位空间上的双射, 不同的 ID 一定得到不同的结果。
+    低 bits 位会被打散到整个 [0, 2^bits) 范围, 较小的 ID 置换后不再较小;
+    tag 长度由固定的 bits 位宽决定 (34 位 base62 编码后最多 6 个字符), 而不是由 ID 大小决定。
+    """
+
+    def __init__(self, secret: str, bits: int = 34, rounds: int = 4):
+        if bits % 2:
+            raise ValueError("bits must be even")
+        self.key = hashlib.blake2b(secret.encode()).digest()[:32]
+        self.bits = bits
+        self.half = bits // 2
+        self.half_mask = (1 << self.half) - 1
+        self.rounds = rounds
+
+    def _round(self, i: int, value: int) -> int:
+        digest = hashlib.blake2b(
+            value.to_bytes(8, "big"), key=self.key, digest_size=8, person=bytes([i]) * 16
+        ).digest()
+        return int.from_bytes(digest, "big") & self.half_mask
+
+    def encrypt(self, num: int) -> int:
+        high, low = num >> self.bits, num & ((1 << self.bits) - 1)
+        left, right = low >> self.half, low & self.half_mask
+        for i in range(self.rounds):
+            left, right = right, left ^ self._round(i, right)
+        return (high << self.bits) | (left << self.half) | right
+
+    def decrypt(self, num: int) -> int:
+        high, low = num >> self.bits, num & ((1 << self.bits) - 1)
+        left, right = low >> self.half, low & self.half_mask
+        for i in reversed(range(self.rounds)):
+            left, right = right ^ self._round(i, left), left
+        return (high << self.bits) | (left << self.half) | right
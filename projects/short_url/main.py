@@ -2,11 +2,12 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
 
-from .infra import SessionLocal
+from .infra import SessionLocal, get_settings
 
 from .app.routes.user import router_user
 from .app.routes.short import router_short
 from .app.lifespan import lifespan
+from .app.fast_redirect import FastRedirectMiddleware
 
 from fastapi_book.utils import register_custom_docs
 
@@ -22,3 +23,6 @@ register_custom_docs(app)
 
 app.include_router(router_user)
 app.include_router(router_short)
+
+if get_settings().FAST_REDIRECT_ENABLED:
+    app.add_middleware(FastRedirectMiddleware)